@@ -1,3 +1,4 @@
-from dayIll import Dayill
-from ill import Illarr
-from pts import RoomGrid,Point
\ No newline at end of file
+from dayIll import Dayill,DayillExpression,DayillStream
+from illIndex import IllRowIndex
+from ill import Illarr,Zoneill,ZoneillSet
+from pts import RoomGrid,RoomGridSet,Point
\ No newline at end of file
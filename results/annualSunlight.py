@@ -19,6 +19,9 @@ import sys
 import multiprocessing as mp
 import random
 
+import numpy as np
+from radmatrix import readRadianceMatrix,illuminanceFromRGB
+
 headerString ="""#?RADIANCE
 oconv black.rad materials.rad sceneASE.rad skies/suns.rad
 rcontrib -I+ -ab 1 -y 109453 -n 16 -ad 256 -lw 1.0e-3 -dc 1 -dt 0 -dj 0 -faa -e MF:6 -f reinhart.cal -b rbin -bn Nrbins -m solar
@@ -99,18 +102,10 @@ def extractIlluminance():
         print(headerStringIll,file=aseFile)
         for fileIdx,fileName in enumerate(sorted(os.listdir(resultName))):
             fileName = os.path.join(resultName,fileName)
-            with open(fileName) as partialData:
-                for idx,lines in enumerate(partialData):
-                    if lines.strip():
-                        try:
-                            lineSplit = lines.split()
-                            lineSplit = map(float, lineSplit)
-                            data = [lineSplit[idx * 3:idx * 3 + 3] for idx in xrange(8760)]
-                            data = [int(val[0] * 47.4 + val[1] * 119.9 + val[2] * 11.6) for val in data]
-                            data = "\t".join(map(str, data))
-                            print(data, file=aseFile)
-                        except ValueError:
-                            pass
+            # The partial results are read in bulk, and the RGB triplets of the 8760 hours are weighted in one go.
+            header,data = readRadianceMatrix(fileName)
+            data = illuminanceFromRGB(data.reshape(len(data),-1,3))
+            np.savetxt(aseFile,data.astype(np.int64),fmt='%d',delimiter='\t')
             print(fileName)
 
 if __name__ == "__main__":
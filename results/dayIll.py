@@ -7,11 +7,170 @@ from programs like Dctimestep and Rmtxop additional functions are provided.
 
 from __future__ import division
 from __future__ import print_function
-from ill import Illarr
+from ill import Illarr,IllStatistics,filterMask,filterDescription
+from radmatrix import readRadianceMatrix
+from illIndex import IllRowIndex
+import metrics
+import parallel
+import filecache
 import pts
 import timeSeries
 from timeSeries2 import TimeArray
-import tempfile,os,warnings
+import tempfile,os,warnings,operator
+import numpy as np
+
+def _maskIndices(pointMask,numPoints):
+    """Return the 0-based point indices selected by a boolean mask or by an array of indices."""
+    pointMask = np.asarray(pointMask)
+    if pointMask.dtype == bool:
+        assert len(pointMask) == numPoints, \
+            'The length of the mask(%s) should be equal to the number of points(%s).'%(len(pointMask),numPoints)
+        return np.flatnonzero(pointMask)
+    pointMask = pointMask.astype(np.intp).ravel()
+    assert np.all((pointMask>=0)&(pointMask<numPoints)), \
+        'The point indices should be between 0 and %s.'%(numPoints-1)
+    return pointMask
+
+def _roundValues(values,digits):
+    """
+    Round values like the builtin round. numpy rounds halves to even, so the values that are close to a half are
+    rounded with round instead.
+    """
+    rounded = np.round(values,digits)
+    scaled = np.abs(values)*10.0**digits
+    nearHalf = np.abs(scaled-np.floor(scaled)-0.5)<1e-6
+    rounded[nearHalf] = [round(val,digits) for val in values[nearHalf]]
+    return rounded
+
+def _illRows(illfile,extradata,columns=None):
+    """
+    Yield the month, date, hour and an array of the illuminance values of every line of a Daysim format ill file.
+    Lines that contain text are added to extradata, as in timeSeries.TimeArray.
+
+    If columns (the indices of the points, starting from 0) is given, only the values of these points are converted
+    to numbers, and each line is only split up to the last of these points.
+    """
+    numValues = None
+    numRows = 0
+    maxSplit = 3
+    if columns is not None:
+        columns = np.asarray(columns,dtype=np.intp)
+        assert len(columns) and columns.min()>=0, 'The columns should be a non-empty list of indices from 0.'
+        maxSplit = int(columns.max())+4
+        getColumns = operator.itemgetter(*(columns+3).tolist())
+
+    with open(illfile) as illText:
+        for lines in illText:
+            lineSplit = lines.split(None,maxSplit)
+            if not lineSplit:
+                continue
+
+            try:
+                try:
+                    month,date,hour = int(lineSplit[0]),int(lineSplit[1]),float(lineSplit[2])
+                except ValueError:
+                    month,date,hour = float(lineSplit[0]),float(lineSplit[1]),float(lineSplit[2])
+
+                if columns is not None and numValues is not None:
+                    assert len(lineSplit)>maxSplit-1, 'The line %s of %s has fewer than the %s values needed for ' \
+                                                      'the selected points.'%(numRows+1,illfile,maxSplit-3)
+                    values = np.array(getColumns(lineSplit),dtype=np.float64).reshape(len(columns))
+                    numRows += 1
+                    yield month,date,hour,values
+                    continue
+
+                if len(lineSplit)<=3:
+                    valueText = ''
+                elif columns is None:
+                    valueText = lineSplit[3]
+                else:
+                    valueText = lines.split(None,3)[3]
+                values = np.fromstring(valueText,dtype=np.float64,sep=' ')
+                if numValues is None or len(values) != numValues:
+                    # np.fromstring stops at the first text value, so check the values of the first line and of any
+                    # line that is shorter or longer than it. Lines with text raise a ValueError here.
+                    lineValues = map(float,valueText.split())
+                    if numValues is None:
+                        numValues = len(lineValues)
+                    assert len(lineValues) == numValues, 'The line %s of %s has %s values instead of ' \
+                                                         '%s.'%(numRows+1,illfile,len(lineValues),numValues)
+                if columns is not None:
+                    assert columns.max()<numValues, 'The point index %s is not in %s, which has %s points.'%(
+                        columns.max(),illfile,numValues)
+                    values = values[columns]
+            except (ValueError,IndexError):
+                if len(lineSplit)>1:
+                    extradata[lineSplit[0]] = lineSplit[1]
+                continue
+
+            numRows += 1
+            yield month,date,hour,values
+
+def _summaryPoints(specificPoints,pointMask,ptsLen):
+    """
+    Return the 0-based indices of the points selected by the specificPoints (starting from 1) or the pointMask of
+    Dayill.pointsIlluminanceTimeSummary.
+    """
+    if pointMask is not None:
+        assert not specificPoints, 'specificPoints and pointMask cannot be specified together.'
+        specificPoints = (_maskIndices(pointMask,ptsLen)+1).tolist()
+
+    if specificPoints:
+        if isinstance(specificPoints,int):
+            specificPoints = [specificPoints]
+
+        ptStatement = "The total number of points in the point file is %s and the value" \
+                      " for points should be between 1 and %s."%(ptsLen,ptsLen)
+
+        assert all(1<=pt<=ptsLen for pt in specificPoints),\
+        "The points %s do not all lie between 1 and %s. %s"%(specificPoints,ptsLen+1,ptStatement)
+
+    elif pointMask is None:
+        specificPoints = range(1,ptsLen+1)
+
+    #Subtract each pt index by 1 so that it is in sync with the standard indexing
+    # for lists.
+    return np.asarray(specificPoints,dtype=np.intp)-1
+
+def _metricBands(sdaThreshold,aseThreshold,udiLow,udiHigh):
+    """Return the bands of sDA, ASE and the low, mid and high UDI bands, as counted by the metric methods."""
+    return [_summaryBand(sdaThreshold,None),_summaryBand(aseThreshold+1,None),
+            _summaryBand(None,udiLow-1),_summaryBand(udiLow,udiHigh),_summaryBand(udiHigh+1,None)]
+
+def _metricsFromCounter(counter,DA,aseHours):
+    """Return the dictionary of Dayill.metricsSummary from a BandCounter of the bands of _metricBands."""
+    summary = {'hours':counter.hours}
+    summary['sDAdetailed'] = _countsList(counter,0,True,3)
+    summary['ASEdetailed'] = _countsList(counter,1,False)
+    summary['UDIdetailed'] = [_countsList(counter,band,False) for band in (2,3,4)]
+    summary['UDIdetailedPercent'] = [_countsList(counter,band,True,3) for band in (2,3,4)]
+    summary['sDA'] = len([val for val in summary['sDAdetailed'] if val >=DA])/counter.numPoints
+    summary['ASE'] = len([val for val in summary['ASEdetailed'] if val>aseHours])/counter.numPoints
+    return summary
+
+def _countedBands(bands):
+    """Replace the bands that are None (no hours counted) with a band that no value can be in."""
+    return [band if band is not None else (np.inf,-np.inf) for band in bands]
+
+def _summaryBand(illMin,illMax):
+    """
+    Return the band of hours counted by Dayill.pointsIlluminanceTimeSummary for illMin and illMax, or None if no
+    hours are counted. As in that method, a limit of 0 only counts when the other limit is given.
+    """
+    if illMin and (illMax is None):
+        return (illMin,None)
+    if illMax and (illMin is None):
+        return (None,illMax)
+    if (illMax is not None) and (illMin is not None):
+        return (illMin,illMax)
+    return None
+
+def _countsList(counter,band,returnPercent=False,percentRoundOff=3):
+    """Return the hour counts of a band of a BandCounter as a list, or as fractions of the hours rounded off."""
+    counts = counter.counts[band].tolist()
+    if returnPercent:
+        return [round(count/counter.hours,percentRoundOff) for count in counts]
+    return counts
 
 class Dayill(timeSeries.TimeArray):
     """This is a class for annual or time series ill files. Needs the ill file path and points file to be instantiated.
@@ -27,20 +186,25 @@ class Dayill(timeSeries.TimeArray):
             illuminanceDataMonthly(month): Get illuminance data for a particular month.
             illuminanceDataHourly(hour): Get illuminance data for a particular hour for every day of the year (or the days
                 for which the data is present).
-            illuminanceDataFull: Get the entire illuminance data in the form of list of lists.
+            illuminanceDataFull: Get the entire illuminance data as an array of hours x points.
         2. For accessing time:
             timeStamps: datetime.datetime values in a tuple for all the points at which data exists. This can be useful
             for plotting.
+            timeIndex: A timeSeries.TimeIndex with arrays of the month, day, hour, hour of the day, weekday and hour of
+            the year of every timestamp, for selecting hours.
         3. For accessing all the data: self.timeData is a list of dictionaries where each dictionary contains the
             following keys: "m":month,"d":date,"h":hour,"data":dataval,"tstamp":timestamp. month,date will usually be
             ints while hour can be a decimal. tstamp is a datetime.datetime object. 'data' is a class of the type
             Illarr
         4. To get a summary of the entire file: Just print the instance through (the __str__ option_).
+        5. The illuminance values are stored in illData, an array of hours x points. The Illarr objects in timedata
+            are views of its rows, and are created the first time that timedata is accessed.
 
     """
 
     def __init__(self,illfile,ptsfile,weaFile=None,convertFromRadiance=False,directoryForConversion=None,
-                 convertedFilePath=None):
+                 convertedFilePath=None,useCache=False,cacheDir=None,dtype=np.float64,processes=1,points=None,
+                 sharedDirectory=None):
         """
         Typical constructor behaviour would involve specifying a Daysim format timeseries file and a pts file as input.
         Another, now frequently occuring possibility, is to do a conversion from a Radiance-format output file to Daysim
@@ -67,9 +231,38 @@ class Dayill(timeSeries.TimeArray):
 
         :type convertedFilePath: basestring
         :param convertedFilePath: The path to which the converted file should be written to.
+
+        :type useCache: bool
+        :param useCache: Set this to True to store the parsed illuminance values, timestamps and points in binary
+            caches and read them from there, memory-mapped, while the ill file and the points file are unchanged. See
+            readIllData and pts.RoomGrid.
+
+        :type cacheDir: basestring
+        :param cacheDir: Directory for the caches. Defaults to the directories of the ill file and the points file.
+
+        :param dtype: Data type of the illuminance values. Defaults to float64. Use float32 to halve the memory used
+            by large files, at the cost of rounding the values to about 7 significant digits.
+
+        :param processes: Number of processes for parsing the ill file and counting the metrics
+            (pointsIlluminanceTimeSummary, sDA, ASE and UDI). Defaults to 1. With more than one process, the ill file
+            is parsed into a temporary memory-mapped file (see readIllData), and the points are divided between a
+            pool of processes for counting the metrics. illData is then always a memory-mapped array that the
+            processes map as well, so the counts do not copy it: a cache is mapped read-only (see readIllData), and
+            other values, such as those of a Dayill computed from others, are copied to a temporary file once, when
+            the Dayill is created. See parallel.countBands.
+
+        :param points: A boolean mask with a value for every point in the points file (for example from
+            RoomGrid.polygonMask), or the indices of the points starting from 0. If given, only the illuminance of
+            these points is read, and roomgrid contains only these points, in the same order. The original indices
+            of the points are stored in pointIndices. Defaults to all the points.
+
+        :param sharedDirectory: Directory for the temporary files that are shared with the processes. Defaults to
+            the temporary directory of the system.
         """
 
         self.illfile = illfile
+        self.processes = processes
+        self.sharedDirectory = sharedDirectory
         self.weaFile = weaFile
         self.ptsfile = ptsfile
         self.__directoryForConversion=directoryForConversion
@@ -85,59 +278,230 @@ class Dayill(timeSeries.TimeArray):
             illfile = self.illfile
             warnings.warn(msg)
 
-        # Call the constructor from timeseries array. This will define self.timedata and self.extradata
-        timeSeries.TimeArray.__init__(self, illfile)
+        # Read the ill file into illData. This replaces the constructor of timeseries array, and timedata is
+        # created from illData when it is needed.
+        self.filename = illfile
         # create a dictionary of points from the pts file.
-        self.roomgrid = pts.RoomGrid(ptsfile)
+        self.roomgrid = pts.RoomGrid(ptsfile,useCache=useCache,cacheDir=cacheDir)
+        self.pointIndices = None
+        if points is not None:
+            self.pointIndices = _maskIndices(points,len(self.roomgrid))
+            self.roomgrid = self.roomgrid.subset(self.pointIndices)
+        self.readIllData(illfile,dtype,useCache=useCache,cacheDir=cacheDir,points=self.pointIndices,
+                         processes=processes,sharedDirectory=sharedDirectory)
+        self._shareIllData()
+
+    def readIllData(self,illfile,dtype=np.float64,useCache=False,cacheDir=None,points=None,processes=1,
+                    sharedDirectory=None):
+        """
+        Read a Daysim format ill file into illData, an array of hours x points, along with timeIndex, a
+        timeSeries.TimeIndex of the timestamps. Lines that contain text are stored in extradata, as in
+        timeSeries.TimeArray.
+
+        If useCache is True, the parsed data is stored in a binary cache next to the ill file (or in cacheDir), and
+        read back from there as long as the size and modification time of the ill file are unchanged. illData is
+        then memory-mapped copy-on-write from the cache, so that it is read from disk only when it is used, several
+        processes share the same pages, and changes to it are not written back to the cache. See filecache. If
+        processes is more than 1, illData is memory-mapped read-only instead, so that the processes that count the
+        metrics can map the cache as well. Copy it to change its values. Every dtype has its own cache (for example
+        ill file.float32.illcache), so that reading a file with different dtypes does not rewrite the cache each time.
+
+        If points (the indices of points starting from 0) is given, only the values of these points are read, so
+        that the memory used is proportional to the number of points selected. The values are copied from the cache
+        if it is valid. Otherwise they are read from the ill file without converting the other values, and the cache
+        is not written.
+
+        If processes is more than 1, the rows are found with an IllRowIndex and are divided into byte ranges that
+        are parsed by a pool of processes into a shared memory-mapped illData. Its temporary file is created in
+        sharedDirectory (or the temporary directory of the system), and removed when illData is garbage collected.
+        See parallel.parseRows.
+        """
+        if useCache:
+            cacheDirPath = filecache.cachePath(illfile,'.%s.illcache'%np.dtype(dtype).name,cacheDir)
+            cachedArrays = filecache.readCache(cacheDirPath,[illfile],mmapMode='r' if processes>1 else 'c')
+            if cachedArrays is not None and cachedArrays['illData'].dtype == np.dtype(dtype):
+                self.illData = cachedArrays['illData'] if points is None else \
+                    np.asarray(cachedArrays['illData'][:,points])
+                self._firstHourFixed = bool(cachedArrays['firstHourFixed'])
+                self.timeIndex = timeSeries.TimeIndex(cachedArrays['month'],cachedArrays['day'],cachedArrays['hour'])
+                self.extradata = dict(cachedArrays['extradata'].tolist())
+                self._timedata = None
+                return
+
+        rowIndex = IllRowIndex(illfile,useCache=useCache,cacheDir=cacheDir) if processes>1 else None
+        if rowIndex is not None and len(rowIndex):
+            numPoints = rowIndex.numPoints
+            if points is not None:
+                assert np.max(points)<numPoints, 'The point index %s is not in %s, which has %s points.'%(
+                    np.max(points),illfile,numPoints)
+            self.illData = parallel.parseRows(illfile,rowIndex.starts,rowIndex.ends,numPoints,points=points,
+                                              dtype=dtype,processes=processes,directory=sharedDirectory)
+            self.extradata = rowIndex.extradata
+            self._firstHourFixed = rowIndex.firstHourFixed
+            self.timeIndex = rowIndex.timeIndex
+        else:
+            numLines = timeSeries.countLines(illfile)
+
+            illData = None
+            months,dates,hours = [],[],[]
+            self.extradata = {}
+
+            for month,date,hour,values in _illRows(illfile,self.extradata,points):
+                if illData is None:
+                    illData = np.empty((numLines,len(values)),dtype=dtype)
+                illData[len(months)] = values
+                months.append(month)
+                dates.append(date)
+                hours.append(hour)
+
+            if illData is None:
+                illData = np.empty((0,0),dtype=dtype)
+
+            self.illData = illData[:len(months)]
+            hours,self._firstHourFixed = timeSeries.fixHours(hours)
+            self.timeIndex = timeSeries.TimeIndex(months,dates,hours)
+        self._timedata = None
+
+        if useCache and points is None:
+            filecache.writeCache(cacheDirPath,[illfile],
+                                 {'illData':self.illData,'month':self.timeIndex.month,'day':self.timeIndex.day,
+                                  'hour':self.timeIndex.hour,'firstHourFixed':self._firstHourFixed,
+                                  'extradata':np.array(sorted(self.extradata.items()),dtype=str).reshape(-1,2)})
 
-        self.timedata_TO_ill()
+    @property
+    def timedata(self):
+        """
+        A list of dictionaries with the keys "m","d","h","data" and "tstamp" for every hour. 'data' is an Illarr
+        that is a view of a row of illData, so changing its values in place changes illData (unless illData is
+        read-only, see readIllData).
+        """
+        if self._timedata is None:
+            timeIndex = self.timeIndex
+            timedata = []
+            for idx,(month,date,hour) in enumerate(zip(timeIndex.month.tolist(),timeIndex.day.tolist(),
+                                                       timeIndex.hour.tolist())):
+                timedata.append({"m":month,"d":date,"h":hour,"data":Illarr(self.illData[idx],self.roomgrid),
+                                 "tstamp":timeSeries.timeStamp(month,date,hour)})
+            if self._firstHourFixed:
+                timedata[0]['tstamp'] = timeSeries.timeStamp(1,1,0.5)
+            self._timedata = timedata
+        return self._timedata
 
     def timedata_TO_ill(self):
         """
         This method populates the illuminance data in the class. DO NOT DELETE !!
+        The Illarr objects of timedata are now created from illData when timedata is first accessed.
         """
-        for timestamps in self.timedata:
-               timestamps['data']=Illarr(timestamps['data'],self.roomgrid)
         return self
 
-    def __add__(self, other):
-        #Create a new timedata, then instantiate a new class of dayill and replace the time data in that with the new time data.
-        #This seems like a very hacky way to do this thing...however it will work for the time being.
+    def _copyWithData(self,illData):
+        """Return a copy of this dayill, sharing the timestamps and roomgrid, with different illuminance values."""
+        newdayill = self.__class__.__new__(self.__class__)
+        newdayill.__dict__.update(self.__dict__)
+        newdayill.illData = illData
+        newdayill._timedata = None
+        newdayill._shareIllData()
+        return newdayill
 
-        newdayill = Dayill(self.illfile,self.ptsfile)
+    def _shareIllData(self):
+        """
+        With more than one process, copy illData to a memory-mapped file that the processes can map, unless it is
+        already mapped from one. See parallel.sharedArray.
+        """
+        if self.processes>1:
+            self.illData = parallel.sharedArray(self.illData,self.sharedDirectory)
 
-        for idx,timestamps in enumerate(self.timedata):
-             newdayill.timedata[idx]['data'] = timestamps['data'] + other
+    def _hourIndices(self,startTime,endTime):
+        """
+        Return the indices of the hours between startTime and endTime. If these are None, they default to the
+        smallest and largest hour of the first 30 timestamps. See timeSeries.TimeIndex.hourWindow.
+        """
+        return self.timeIndex.hourWindow(startTime,endTime)
+
+    def lazy(self):
+        """
+        Return a DayillExpression of this dayill. Operations on it are not computed until its evaluate method is
+        called, so that an expression such as (daylight.lazy()+electric)*0.8 is computed in a single pass.
+        """
+        return DayillExpression(self)
+
+    def _arithmetic(self,operator,other,reverse=False):
+        """
+        Compute self operator other (or other operator self) into a new Dayill that shares the timestamps and points
+        of this one. Neither operand is changed or read from disk again. An expression stays lazy.
+        """
+        expression = DayillExpression(other,operator,self) if reverse else DayillExpression(self,operator,other)
+        if isinstance(other,DayillExpression):
+            return expression
+        return expression.evaluate()
+
+    def __add__(self, other):
+        # The other operand (a Dayill, an Illarr, a scalar or a value for every point) is applied to every hour.
+        return self._arithmetic('+',other)
+
+    __radd__ = __add__
 
-        return newdayill
     def __sub__(self, other):
-        newdayill = Dayill(self.illfile,self.ptsfile)
+        return self._arithmetic('-',other)
 
-        for idx,timestamps in enumerate(self.timedata):
-             newdayill.timedata[idx]['data'] = timestamps['data'] - other
+    def __rsub__(self, other):
+        return self._arithmetic('-',other,reverse=True)
 
-        return newdayill
     def __mul__(self, other):
-        newdayill = Dayill(self.illfile,self.ptsfile)
+        return self._arithmetic('*',other)
 
-        for idx,timestamps in enumerate(self.timedata):
-             newdayill.timedata[idx]['data'] = timestamps['data'] * other
+    __rmul__ = __mul__
 
-        return newdayill
+    def __truediv__(self, other):
+        return self._arithmetic('/',other)
+
+    __div__ = __truediv__
+
+    def __rtruediv__(self, other):
+        return self._arithmetic('/',other,reverse=True)
+
+    __rdiv__ = __rtruediv__
+
+    def illLimitsArray(self,maxval=2500,minval=200,chunkHours=256):
+        """
+        Return an array of hours x 2 containing the number and the fraction of points whose illuminance is
+        selected by Illarr.filterill(maxval,minval) for every hour.
+        """
+        data = self.illData
+        counts = np.empty(len(data))
+        for start in range(0,len(data),chunkHours):
+            counts[start:start+chunkHours] = np.count_nonzero(filterMask(data[start:start+chunkHours],maxval,minval),
+                                                              axis=1)
+        return np.column_stack((counts,counts/data.shape[1]))
 
     def illLimits(self,maxval=2500,minval=200,verbose=False,percent=False):
-        return [timestamps['data'].filterill(maxval,minval,verbose=verbose,
-                                             percent=percent)for timestamps in self.timedata]
+        limits = self.illLimitsArray(maxval,minval)
+        counts = limits[:,0].astype(int).tolist()
+
+        if verbose:
+            description = filterDescription(len(self.roomgrid.ptsarr),maxval,minval)
+            return [{description:count} for count in counts]
+        elif percent:
+            return [round(fraction,3) for fraction in limits[:,1].tolist()]
+        return counts
+
+    def illStatistics(self,percentiles=()):
+        """
+        Return an IllStatistics containing the mean, minimum, maximum, uniformity ratios and the specified
+        percentiles (between 0 and 100) of the illuminance for all the hours. The points at the minimum or maximum
+        of an hour can be found with its minPoints(hour) and maxPoints(hour) methods.
+        """
+        return IllStatistics(self.illData,self.roomgrid,percentiles)
 
     @property
     def max_ill(self):
          """Returns a list Maximum illuminance in the space for all hours."""
-         return [timestamps['data'].max_ill['max_ill'] for timestamps in self.timedata]
+         return self.illStatistics().max.tolist()
 
     @property
     def min_ill(self):
         """Returns a list Minimum illuminance in the space for all hours."""
-        return [timestamps['data'].min_ill['min_ill'] for timestamps in self.timedata]
+        return self.illStatistics().min.tolist()
 
     def singlePointIlluminance(self, gridPtIndex, startTime=None, endTime=None, returnAsPercentOf=None,
                                returnAsDifferenceFrom=None,percentRoundOff=3):
@@ -151,45 +515,32 @@ class Dayill(timeSeries.TimeArray):
         :param returnAsDifferenceFrom: For (x - returnAsDifferenceFrom) where x is illuminance
             at a given hour.
         :param percentRoundOff: Defaults to 3.
-        :return:
+        :return: An array with the illuminance at the point for the selected hours.
         """
 
         #get the size of room.
         gridSize = self.roomgrid.gridSizeActual
 
-        #get a list of minimum and maximum hours from the first 25 data points.
-        possibleHours = [t['h'] for t in self.timedata[:30]]
-
-        if startTime is None:
-            startTime = min(possibleHours)
-
-        if endTime is None:
-            endTime = max(possibleHours)
-
-        assert gridPtIndex in range(1, gridSize + 1), \
+        assert 1 <= gridPtIndex <= gridSize and int(gridPtIndex) == gridPtIndex, \
             'The value for gridPtIndex(%s) must be between 1 and %s'%(gridPtIndex,gridSize)
 
-        illuminanceData=[]
-
-        for timeStamps in self.timedata:
-            if startTime <= timeStamps['h'] <= endTime:
-                illuminanceData.append(timeStamps['data'].illarr[gridPtIndex-1])
+        illuminanceData = self.illData[timeSeries.indexer(self._hourIndices(startTime,endTime)),int(gridPtIndex)-1]
 
         assert not (returnAsDifferenceFrom and returnAsPercentOf),\
             "Both returnAsDifferenceFrom(%s) and returnAsPercentOf(%s) cannot be specified" \
             "."%(returnAsDifferenceFrom,returnAsPercentOf)
 
         if returnAsDifferenceFrom is not None:
-            illuminanceData = [round(val-returnAsDifferenceFrom,percentRoundOff) for val in illuminanceData]
+            illuminanceData = _roundValues(illuminanceData-np.float64(returnAsDifferenceFrom),percentRoundOff)
 
         if returnAsPercentOf is not None:
-            illuminanceData = [round(val/returnAsPercentOf,percentRoundOff) for val in illuminanceData]
+            illuminanceData = _roundValues(illuminanceData/np.float64(returnAsPercentOf),percentRoundOff)
 
         return illuminanceData
 
     def pointsIlluminanceTimeSummary(self,illMin=None, illMax=None,
                                      startTime=None,endTime=None,returnPercent=False,
-                                     specificPoints=None,percentRoundOff=3):
+                                     specificPoints=None,percentRoundOff=3,pointMask=None):
         """
         Return the illuminance summary of a room in terms of hours. The returned value
         will be a list containing data pertaining to grid points. Each data point in that
@@ -220,74 +571,88 @@ class Dayill(timeSeries.TimeArray):
             are based on sequence in the pts file and start from 1 (and not zero).
             So, for a pts file with 100 points the valid input will be any number(s) between
             1 and 100.
+        :param pointMask: A boolean array with a value for every point, or an array of point indices starting
+            from 0, for example from RoomGrid.polygonMask. Only the selected points will be returned. This cannot
+            be specified along with specificPoints.
         :return:
         """
 
-        #get a list of minimum and maximum hours from the first 25 data points.
-        possibleHours = [t['h'] for t in self.timedata[:30]]
-
-        if startTime is None:
-            startTime = min(possibleHours)
-
-        if endTime is None:
-            endTime = max(possibleHours)
-
         assert not ((illMin is None) and (illMax is None)),\
             'Both illMin and illMax cannot be specified as None'
 
         assert not ((illMin is False) or (illMax is False)),\
             'illMin(%s) and illMax(%s) can either be an integer or None. They cannot be False.'%(illMin,illMax)
 
-        illuminanceData=[]
-        hourCount = 0
-        for timeStamps in self.timedata:
-            if startTime <= timeStamps['h'] <= endTime:
-                hourCount +=1
-                illuminanceData.append(timeStamps['data'].illarr)
-
-        illuminanceData = zip(*illuminanceData)
-        ptsLen = len(illuminanceData)
-
-        if specificPoints:
-            if isinstance(specificPoints,int):
-                specificPoints = [specificPoints]
-
-            ptStatement = "The total number of points in the point file is %s and the value" \
-                          " for points should be between 1 and %s."%(ptsLen,ptsLen)
+        specificPoints = _summaryPoints(specificPoints,pointMask,self.illData.shape[1])
+        counter = self.bandCounts([_summaryBand(illMin,illMax)],startTime,endTime,specificPoints)
+        return _countsList(counter,0,returnPercent,percentRoundOff)
 
-            assert len([pt for pt in specificPoints if pt in range(1,ptsLen+1)])==len(specificPoints),\
-            "The points %s do not all lie between 1 and %s. %s"%(specificPoints,ptsLen+1,ptStatement)
-
-        else:
-            specificPoints = range(1,ptsLen+1)
+    def bandCounts(self,bands,startTime=None,endTime=None,pointMask=None):
+        """
+        Count the hours for which the illuminance at each point lies within any number of bands, in one pass over
+        the data. See metrics.BandCounter.
+
+        :param bands: A list of (lower,upper) illuminance limits. Both limits are included in a band, and a limit of
+            None leaves that side of the band open. A band of None counts no hours.
+        :param startTime: Hour of the day at which to begin counting. Defaults to the first hour of the data.
+        :param endTime: Hour of the day at which to stop counting. Defaults to the last hour of the data.
+        :param pointMask: Boolean mask or indices (starting from 0) of the points to be counted. Defaults to all
+            points.
+        :return: A metrics.BandCounter, whose counts and fractions are arrays of bands x points.
+        """
+        hourIndices = self._hourIndices(startTime,endTime)
+        pointIndices = None
+        if pointMask is not None:
+            pointIndices = _maskIndices(pointMask,self.illData.shape[1])
+            if np.array_equal(pointIndices,np.arange(self.illData.shape[1])):
+                pointIndices = None
 
-        #Subtract each pt index by 1 so that it is in sync with the standard indexing
-        # for lists.
+        if self.processes>1:
+            return parallel.countBands(self.illData,_countedBands(bands),hourIndices,pointIndices,self.processes,
+                                       directory=self.sharedDirectory)
 
-        specificPoints = [pt-1 for pt in specificPoints]
+        return metrics.countBands(self.illData,_countedBands(bands),hourIndices,pointIndices)
 
-        pointsData = []
-        for pt in specificPoints:
-            ptHourCount = 0
-            for hourlyIlluminanceValue in illuminanceData[pt]:
-                if illMin and (illMax is None):
-                    if hourlyIlluminanceValue >= illMin:
-                        ptHourCount +=1
-                if illMax and (illMin is None):
-                    if hourlyIlluminanceValue <= illMax:
-                        ptHourCount +=1
-                if (illMax is not None) and (illMin is not None):
-                    if illMax>= hourlyIlluminanceValue >= illMin:
-                        ptHourCount +=1
+    def thresholdSweep(self,startTime=8,endTime=18,pointMask=None):
+        """
+        Sort the illuminance of every point over the hours between startTime and endTime once, for evaluating sDA,
+        ASE and UDI at many thresholds and fractions. For example, thresholdSweep().sDATable(range(100,3001,100),
+        [0.4,0.5,0.6]) returns the sDA for 30 thresholds and 3 DA cut-offs. See metrics.ThresholdSweep.
 
-            if returnPercent:
-                ptHourCount = round(ptHourCount/hourCount,percentRoundOff)
+        :param startTime: Defaults to 8.
+        :param endTime: Defaults to 18.
+        :param pointMask: Boolean mask or indices of the points to be evaluated. Defaults to all points.
+        :return: A metrics.ThresholdSweep.
+        """
+        data = self.illData[self._hourIndices(startTime,endTime)]
+        if pointMask is not None:
+            data = data[:,_maskIndices(pointMask,self.illData.shape[1])]
+        return metrics.ThresholdSweep(data)
 
-            pointsData.append(ptHourCount)
+    def metricsSummary(self,startTime=8,endTime=18,sdaThreshold=300,DA=0.5,aseThreshold=1000,aseHours=250,
+                       udiLow=100,udiHigh=2000,pointMask=None):
+        """
+        Calculate sDA, ASE and UDI together, with a single pass over the data. The values are the same as those of
+        metricSDA, metricSDAdetailed, metricASE, metricASEdetailed and metricUDIdetailed with the same arguments.
 
-        return pointsData
+        :param startTime: Defaults to 8.
+        :param endTime: Defaults to 18.
+        :param sdaThreshold: Threshold illuminance for sDA. Defaults to 300 lux.
+        :param DA: Fraction of hours above which a point is counted for sDA. Defaults to 0.5.
+        :param aseThreshold: Threshold illuminance for ASE. Defaults to 1000 lux.
+        :param aseHours: Hours beyond which a point is counted for ASE. Defaults to 250.
+        :param udiLow: Lower illuminance threshold for UDI. Defaults to 100 lux.
+        :param udiHigh: Higher illuminance threshold for UDI. Defaults to 2000 lux.
+        :param pointMask: Boolean mask or indices of the points to be evaluated. Defaults to all points.
+        :return: A dictionary containing sDA and ASE, the per-point sDAdetailed (fraction of hours), ASEdetailed
+            (hours) and UDIdetailed (hours in the low, mid and high bands), UDIdetailedPercent (fractions of hours
+            in the UDI bands), and the number of hours.
+        """
+        counter = self.bandCounts(_metricBands(sdaThreshold,aseThreshold,udiLow,udiHigh),startTime,endTime,
+                                  pointMask)
+        return _metricsFromCounter(counter,DA,aseHours)
 
-    def metricSDAdetailed(self, illThreshold=300, startTime=8, endTime=18):
+    def metricSDAdetailed(self, illThreshold=300, startTime=8, endTime=18, pointMask=None):
         """
         Spatial Daylight Autonomy is the percentage of points in a room that exceed a
         threshold of 300 lux for more than 50% of the analysis time. This function
@@ -302,15 +667,16 @@ class Dayill(timeSeries.TimeArray):
         :param illThreshold: Threshold illuminance for SDA. Defaults to 300 lux.
         :param startTime: Defaults to 8.
         :param endTime: Defaults to 18.
+        :param pointMask: Boolean mask or indices of the points to be evaluated. Defaults to all points.
         :return:
         """
 
         data = self.pointsIlluminanceTimeSummary(illMin=illThreshold, startTime=startTime,
-                                                 endTime=endTime, returnPercent=True)
+                                                 endTime=endTime, returnPercent=True, pointMask=pointMask)
 
         return data
 
-    def metricSDA(self, illThreshold=300, startTime=8, endTime=18,DA=0.5):
+    def metricSDA(self, illThreshold=300, startTime=8, endTime=18,DA=0.5,pointMask=None):
         """
         Spatial Daylight Autonomy is the percentage of points in a room that exceed a
         threshold of 300 lux for more than 50% of the analysis time. This function will return
@@ -324,17 +690,19 @@ class Dayill(timeSeries.TimeArray):
         :param illThreshold: Threshold illuminance for SDA. Defaults to 300 lux.
         :param startTime: Defaults to 8.
         :param endTime: Defaults to 18.
+        :param pointMask: Boolean mask or indices of the points in the sub-area to be evaluated, for example from
+            RoomGrid.polygonMask. Defaults to all points.
         :return:
         """
 
         data = self.metricSDAdetailed(illThreshold=illThreshold,startTime=startTime,
-                                      endTime=endTime)
+                                      endTime=endTime,pointMask=pointMask)
 
         data = len([val for val in data if val >=DA])/len(data)
 
         return data
 
-    def metricASEdetailed(self,illThreshold=1000,startTime=8,endTime=18,returnAsPercent=False):
+    def metricASEdetailed(self,illThreshold=1000,startTime=8,endTime=18,returnAsPercent=False,pointMask=None):
         """
         ASE is defined as the percent of sensors in the analysis area that are found to
         be exposed to more than 1000 lux of direct sunlight for more than 250 hours. This function
@@ -352,14 +720,16 @@ class Dayill(timeSeries.TimeArray):
         :param illThreshold: Threshold value for ASE
         :param startTime: Defaults to 8
         :param endTime: Defaults to 18
+        :param pointMask: Boolean mask or indices of the points to be evaluated. Defaults to all points.
         :return:
         """
         #Note that illuminance should more than the threshold.
         data = self.pointsIlluminanceTimeSummary(illMin=illThreshold+1, startTime=startTime,
-                                                 endTime=endTime,returnPercent=returnAsPercent)
+                                                 endTime=endTime,returnPercent=returnAsPercent,
+                                                 pointMask=pointMask)
         return data
 
-    def metricASE(self, illThreshold=1000, startTime=8, endTime=18,hours=250):
+    def metricASE(self, illThreshold=1000, startTime=8, endTime=18,hours=250,pointMask=None):
         """
         ASE is defined as the percent of sensors in the analysis area that are found to
         be exposed to more than 1000 lux of direct sunlight for more than 250 hours. This function
@@ -372,18 +742,20 @@ class Dayill(timeSeries.TimeArray):
         :param illThreshold: Threshold value for ASE
         :param startTime: Defaults to 8
         :param endTime: Defaults to 18
+        :param pointMask: Boolean mask or indices of the points in the sub-area to be evaluated, for example from
+            RoomGrid.polygonMask. Defaults to all points.
         :return:
         """
         # Note that illuminance should more than the threshold.
         data = self.metricASEdetailed(illThreshold=illThreshold,startTime=startTime,
-                                      endTime=endTime)
+                                      endTime=endTime,pointMask=pointMask)
 
         data = len([val for val in data if val>hours])/len(data)
 
         return data
 
     def metricUDIdetailed(self,illThresholdLow=100,illThresholdHigh=2000,startTime=8,
-                          endTime=18,returnAsPercent=False):
+                          endTime=18,returnAsPercent=False,pointMask=None):
         """
         The illThresholdLow and illThresholdHigh values are based on Reinhart,Mardaljevic
         and Rogers. 2006.
@@ -393,6 +765,7 @@ class Dayill(timeSeries.TimeArray):
         :param endTime: Defaults to 18.
         :param returnAsPercent: Defaults to False. Set this to True to get percentage values
         for plotting.
+        :param pointMask: Boolean mask or indices of the points to be evaluated. Defaults to all points.
 
         :return: A list containing three tuples corresponding to UDImin, UDImid, UDImax.
         The size of each tuple is equal to the number of grid points. The data inside each
@@ -401,15 +774,11 @@ class Dayill(timeSeries.TimeArray):
 
         """
 
-        illLow = self.pointsIlluminanceTimeSummary(illMax=illThresholdLow-1,startTime=startTime,
-                                                   endTime=endTime,returnPercent=returnAsPercent)
-        illMid = self.pointsIlluminanceTimeSummary(illMin=illThresholdLow,
-                                                   illMax=illThresholdHigh,startTime=startTime,
-                                                   endTime=endTime,returnPercent=returnAsPercent)
-        illMax = self.pointsIlluminanceTimeSummary(illMin=illThresholdHigh+1,
-                                                   startTime=startTime,
-                                                   endTime=endTime,returnPercent=returnAsPercent)
-        return [illLow,illMid,illMax]
+        # The three bands are counted together.
+        bands = [_summaryBand(None,illThresholdLow-1),_summaryBand(illThresholdLow,illThresholdHigh),
+                 _summaryBand(illThresholdHigh+1,None)]
+        counter = self.bandCounts(bands,startTime,endTime,pointMask)
+        return [_countsList(counter,band,returnAsPercent) for band in range(3)]
 
     def summaryPts(self):
         """Return a dictionary containing the summary of the grid points file"""
@@ -422,60 +791,35 @@ class Dayill(timeSeries.TimeArray):
         value can be between 0 to 8759.
         :type hour: int
         :param hour: Hour of the year based on index.
+        :return: A view of the row of illData for that hour.
         """
-        timeData = self.timedata
-        assert hour<len(timeData),'The hour(%s) entered is an index that is higher than the number of hourly data ' \
-                                  'points(%s).'%(hour,len(timeData))
-        illumData = list(timeData[hour]['data'].illarr)
-        return illumData
+        assert hour<len(self.illData),'The hour(%s) entered is an index that is higher than the number of hourly ' \
+                                      'data points(%s).'%(hour,len(self.illData))
+        return self.illData[hour]
 
     def illuminanceDataMonthly(self,month):
         """
         Get illuminance data for a specific month.
         :param month:
-        :return:
+        :return: The rows of illData for that month, which are a view of illData if the hours of the month are
+            evenly spaced.
         """
-        timeStamps = self.timeStamps
-        months = [val.month for val in timeStamps]
-        assert month in months,'The month %s was not found in timeStamps. ' \
-                               'The months in the current data set are: %s'%(month," ".join(map(str,sorted(set(months)))))
-        illumData = self.illuminanceDataFull
-
-        illumDataMonthly = []
-        for idx,ill in enumerate(illumData):
-            currMonth = months[idx]
-            if currMonth == month:
-                illumDataMonthly.append(ill)
-
-        return illumDataMonthly
+        return self.illData[self.timeIndex.selectMonth(month)]
 
     def illuminanceDataHourly(self,hour):
         """
         Get illuminance data for a specific hour
         :param hour: Hour for which the data is to be extracted.
-        :return:
+        :return: The rows of illData for that hour of every day, which are a view of illData if every day has the
+            same hours.
         """
-        timeStamps = self.timeStamps
-        hours = [val.hour for val in timeStamps]
-        assert hour in hours,'The hour %s was not found in timeStamps. ' \
-                               'The hours in the current data set are: %s'%(hour," ".join(map(str,sorted(set(hours)))))
-        illumData = self.illuminanceDataFull
-
-        illumDataHourly = []
-        for idx,ill in enumerate(illumData):
-            currHour = hours[idx]
-            if currHour == hour:
-                illumDataHourly.append(ill)
-
-        return illumDataHourly
+        return self.illData[self.timeIndex.selectHourOfDay(hour)]
 
     @property
     def illuminanceDataFull(self):
         """Return the illuminance data for the entire dataset. This will typically be 8760 values but could be lower,
-        based on how many timestamps there are."""
-        timeData = self.timedata
-        illumData = [list(val['data'].illarr) for val in timeData]
-        return illumData
+        based on how many timestamps there are. This is illData itself, an array of hours x points."""
+        return self.illData
 
     @property
     def timeStamps(self):
@@ -485,6 +829,56 @@ class Dayill(timeSeries.TimeArray):
         timeStamp = [data['tstamp'] for data in timeData]
         return timeStamp
 
+    def rasterHours(self,hours=None):
+        """
+        Return the illuminance for one or more hours as rectangular grids. See RoomGrid.rasterize.
+
+        :param hours: A single hour index, a list of hour indices or a slice. Defaults to all the hours.
+        :return: An array of shape (X, Y) for a single hour or (hours, X, Y) for several hours, with NaN at the
+            locations that do not have a point.
+        """
+        if hours is None:
+            hours = slice(None)
+        return self.roomgrid.rasterize(self.illData[hours])
+
+    def rasterMetric(self,values):
+        """
+        Return a metric result, for example the output of metricSDAdetailed, as a rectangular grid. See
+        RoomGrid.rasterize.
+        """
+        return self.roomgrid.rasterize(values)
+
+    def writeRaster(self,outputFile,hours=None,values=None,dtype=np.float32,chunkHours=256):
+        """
+        Write rectangular grids of illuminance to a .npy file, which can be read with numpy.load(outputFile,
+        mmap_mode='r') to render one frame at a time.
+
+        :param outputFile: Path of the .npy file.
+        :param hours: A list of hour indices or a slice. Defaults to all the hours. Ignored if values is provided.
+        :param values: Per-point values to write instead of hourly illuminance, for example a metric result.
+        :param dtype: Data type of the written values. Defaults to float32.
+        :param chunkHours: Number of hours that are gridded at a time.
+        :return: outputFile
+        """
+        if values is not None:
+            np.save(outputFile,self.rasterMetric(values).astype(dtype))
+            return outputFile
+
+        if hours is None:
+            hours = slice(None)
+        if isinstance(hours,slice):
+            hours = range(len(self.illData))[hours]
+        hours = list(hours)
+
+        frameShape = self.rasterHours(hours[:1]).shape[1:]
+        frames = np.lib.format.open_memmap(outputFile,mode='w+',dtype=dtype,shape=(len(hours),)+frameShape)
+        for start in range(0,len(hours),chunkHours):
+            frames[start:start+chunkHours] = self.rasterHours(hours[start:start+chunkHours])
+        frames.flush()
+        del frames
+
+        return outputFile
+
     def mergeTimesFromDaysim(self, outputFile=None, sigFigForResults=2, outputFileSuffix='_rev.ill', useTempFile=True,
                              roundToInt=True):
         """
@@ -525,31 +919,52 @@ class Dayill(timeSeries.TimeArray):
 
         daysimFileData = TimeArray(daysimTimeSeriesFmtFile).timestamps
 
-        textData = ""
-        countHOY = 0
-        with open(illFile) as illData, open(outputFile, 'w') as illWrite:
-            for lines in illData:
-                lines = lines.strip()
-                if lines:
-                    try:
-                        illValues = map(float, lines.split())
-
-                        if isinstance(sigFigForResults, int):
-                            illValues = [round(val, sigFigForResults) for val in illValues]
-
-                        if roundToInt:
-                            illValues = [int(val) for val in illValues]
-                        illValues = map(str, illValues)
-
-                        illValues = list(daysimFileData[countHOY]) + illValues
-
-                        illValues = map(str, illValues)
-                        illValues = " ".join(illValues) + '\n'
-                        illWrite.write(illValues)
-
-                        countHOY += 1
-                    except ValueError:
-                        textData += "\n" + lines
+        try:
+            illValues = readRadianceMatrix(illFile)[1]
+        except ValueError:
+            illValues = None
+
+        if illValues is None:
+            # Files with text outside the header are read line by line, skipping the lines with text.
+            textData = ""
+            countHOY = 0
+            with open(illFile) as illData, open(outputFile, 'w') as illWrite:
+                for lines in illData:
+                    lines = lines.strip()
+                    if lines:
+                        try:
+                            illValues = map(float, lines.split())
+
+                            if isinstance(sigFigForResults, int):
+                                illValues = [round(val, sigFigForResults) for val in illValues]
+
+                            if roundToInt:
+                                illValues = [int(val) for val in illValues]
+                            illValues = map(str, illValues)
+
+                            illValues = list(daysimFileData[countHOY]) + illValues
+
+                            illValues = map(str, illValues)
+                            illValues = " ".join(illValues) + '\n'
+                            illWrite.write(illValues)
+
+                            countHOY += 1
+                        except ValueError:
+                            textData += "\n" + lines
+            return outputFile
+
+        assert len(illValues) <= len(daysimFileData), \
+            'The file %s has more rows(%s) than there are timestamps(%s).' % (illFile, len(illValues), len(daysimFileData))
+
+        illValues = np.asarray(illValues,dtype=np.float64).reshape(len(illValues),-1)
+        if isinstance(sigFigForResults, int):
+            illValues = _roundValues(illValues,sigFigForResults)
+        if roundToInt:
+            illValues = illValues.astype(np.int64)
+
+        with open(outputFile, 'w') as illWrite:
+            for timeStamp,rowValues in zip(daysimFileData,illValues.tolist()):
+                illWrite.write(" ".join(map(str,list(timeStamp)+rowValues))+'\n')
 
         return outputFile
 
@@ -562,11 +977,11 @@ class Dayill(timeSeries.TimeArray):
         data = "Files and Points Summary:" +"\n\t" +ptsData
 
 
-        timeData = self.timedata
-        months = list(sorted(set([val['m'] for val in timeData])))
-        dates = list(sorted(set([val['d'] for val in timeData])))
-        hours = list(sorted(set([val['h'] for val in timeData])))
-        dataSetLength = len(timeData)
+        timeIndex = self.timeIndex
+        months = np.unique(timeIndex.month).tolist()
+        dates = np.unique(timeIndex.day).tolist()
+        hours = np.unique(timeIndex.hour).tolist()
+        dataSetLength = len(timeIndex)
 
         data+="\n\nTimeSeries summary:"
         data+="\n\tMonths(%s): %s"%(len(months),",".join(map(str,months)))
@@ -576,5 +991,312 @@ class Dayill(timeSeries.TimeArray):
         return data
 
 
+class DayillExpression(object):
+    """
+    An arithmetic expression of Dayill objects that is evaluated when it is needed. For example, with daylight and
+    electric being Dayill objects, (daylight.lazy()+electric)*0.8 does not compute anything until evaluate() is
+    called, which then computes the whole expression a chunk of hours at a time into a single new array, instead of
+    creating a full hours x points array for every operation.
+
+    The operands can be Dayill objects sharing the same timestamps and points, scalars, Illarr objects or arrays
+    with a value for every point (which are applied to every hour), and arrays of hours x points.
+    """
+    _operators = {'+':np.add,'-':np.subtract,'*':np.multiply,'/':np.true_divide}
+
+    def __init__(self,operand,operator=None,other=None):
+        """
+        :param operand: A Dayill object (or another DayillExpression), or the left operand of operator.
+        :param operator: One of +,-,* and /. If None, the expression is just operand.
+        :param other: The right operand of operator.
+        """
+        assert operator is None or operator in self._operators, \
+            'The operator(%s) should be one of %s.'%(operator,sorted(self._operators))
+        self.operand = operand
+        self.operator = operator
+        self.other = other
+        self.dayill = self._findDayill()
+        assert self.dayill is not None, 'An expression needs at least one Dayill object.'
+
+    def _findDayill(self):
+        """Return the first Dayill object in the expression."""
+        for operand in (self.operand,self.other):
+            if isinstance(operand,Dayill):
+                return operand
+            if isinstance(operand,DayillExpression):
+                return operand.dayill
+        return None
+
+    def _leaves(self):
+        """Yield the operands that are not expressions."""
+        for operand in ((self.operand,) if self.operator is None else (self.operand,self.other)):
+            if isinstance(operand,DayillExpression):
+                for leaf in operand._leaves():
+                    yield leaf
+            else:
+                yield operand
+
+    @staticmethod
+    def _values(operand):
+        """Return the values of an operand that is not an expression."""
+        if isinstance(operand,Dayill):
+            return operand.illData
+        return Illarr._operand(operand)
+
+    def _checkOperands(self):
+        """Check that all the Dayill operands have the same timestamps and points, and return the result dtype."""
+        dayill = self.dayill
+        shape = dayill.illData.shape
+        values = []
+        for leaf in self._leaves():
+            if isinstance(leaf,Dayill) and leaf is not dayill:
+                assert leaf.illData.shape == shape, \
+                    'The shape of the data(%s) should be the same as that of the first Dayill(%s).'%(
+                        leaf.illData.shape,shape)
+                assert leaf.timeIndex.sameAs(dayill.timeIndex), \
+                    'Dayill objects with different timestamps cannot be combined.'
+            leafValues = self._values(leaf)
+            if leafValues.ndim == 2:
+                assert leafValues.shape == shape, \
+                    'The shape of the array(%s) should be hours x points%s.'%(leafValues.shape,shape)
+            values.append(leafValues)
+        return np.result_type(*values)
+
+    def _evaluateBlock(self,hours,out,scratch):
+        """
+        Compute the expression for a slice of hours into out. scratch is a list of buffers of the same size as out,
+        for the results of nested expressions, which are reused from one chunk to the next.
+        """
+        def blockValues(operand):
+            values = self._values(operand)
+            return values[hours] if values.ndim == 2 else values
+
+        if self.operator is None:
+            if isinstance(self.operand,DayillExpression):
+                return self.operand._evaluateBlock(hours,out,scratch)
+            out[...] = blockValues(self.operand)
+            return out
+
+        ufunc = self._operators[self.operator]
+        if isinstance(self.operand,DayillExpression):
+            left = self.operand._evaluateBlock(hours,out,scratch)
+            if isinstance(self.other,DayillExpression):
+                right = self.other._evaluateBlock(hours,scratch[0][:len(out)],scratch[1:])
+            else:
+                right = blockValues(self.other)
+        elif isinstance(self.other,DayillExpression):
+            left = blockValues(self.operand)
+            right = self.other._evaluateBlock(hours,out,scratch)
+        else:
+            left,right = blockValues(self.operand),blockValues(self.other)
+        return ufunc(left,right,out=out)
+
+    def _depth(self):
+        """Return the number of scratch buffers needed to evaluate the expression."""
+        if self.operator is None:
+            return self.operand._depth() if isinstance(self.operand,DayillExpression) else 0
+        if not isinstance(self.operand,DayillExpression):
+            return self.other._depth() if isinstance(self.other,DayillExpression) else 0
+        # The right operand is computed into a scratch buffer while the left one is held in out.
+        right = self.other._depth()+1 if isinstance(self.other,DayillExpression) else 0
+        return max(self.operand._depth(),right)
+
+    def evaluate(self,chunkHours=None):
+        """
+        Compute the expression in one pass over the hours.
+
+        :param chunkHours: Number of hours computed at a time. Defaults to about 256k values per chunk, so that a
+            chunk and its intermediate results stay in the cache of the processor.
+        :return: A new Dayill object with the result. It shares its timestamps and points with the first Dayill in
+            the expression, and none of the operands are changed.
+        """
+        dtype = self._checkOperands()
+        numHours,numPoints = self.dayill.illData.shape
+        chunkHours = chunkHours or max(1,(1<<18)//max(1,numPoints))
+
+        illData = np.empty((numHours,numPoints),dtype=dtype)
+        scratch = [np.empty((min(chunkHours,numHours),numPoints),dtype=dtype) for _ in xrange(self._depth())]
+        for start in xrange(0,numHours,chunkHours):
+            hours = slice(start,start+chunkHours)
+            self._evaluateBlock(hours,illData[hours],scratch)
+
+        return self.dayill._copyWithData(illData)
+
+    def __add__(self, other):
+        return DayillExpression(self,'+',other)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return DayillExpression(self,'-',other)
+
+    def __rsub__(self, other):
+        return DayillExpression(other,'-',self)
+
+    def __mul__(self, other):
+        return DayillExpression(self,'*',other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return DayillExpression(self,'/',other)
+
+    __div__ = __truediv__
+
+    def __rtruediv__(self, other):
+        return DayillExpression(other,'/',self)
+
+    __rdiv__ = __rtruediv__
+
+
+class DayillStream(object):
+    """
+    Metrics of an ill file that is too large to be held in memory. The file is read a chunk of hours at a time, with
+    each chunk taking up to memoryBudget bytes, and the metrics are accumulated over the chunks. Every method reads
+    the file once. The results are the same as those of the Dayill methods with the same names.
+    """
+    def __init__(self,illfile,ptsfile=None,memoryBudget=256*2**20,dtype=np.float64,useCache=False,cacheDir=None):
+        """
+        :param illfile: A time series file of illuminance values in Daysim format.
+        :param ptsfile: The points file corresponding to that ill file. Optional, the metrics do not need it.
+        :param memoryBudget: The memory, in bytes, that a chunk of hours can take up, including the temporary arrays
+            used for counting. Defaults to 256 MB. A chunk always contains at least 30 hours, so that the default
+            hour window of the metrics can be found from the first chunk.
+        :param dtype: Data type of the values in a chunk. Defaults to float64.
+        :param useCache: Use the binary cache of the points file. See pts.RoomGrid.
+        :param cacheDir: Directory for the cache of the points file.
+        """
+        assert os.path.exists(illfile),'The ill file %s was not found'%illfile
+        self.illfile = illfile
+        self.ptsfile = ptsfile
+        self.memoryBudget = memoryBudget
+        self.dtype = np.dtype(dtype)
+        self.extradata = {}
+        self.roomgrid = pts.RoomGrid(ptsfile,useCache=useCache,cacheDir=cacheDir) if ptsfile else None
+        self.numPoints = None
+
+    def chunkHours(self,numPoints):
+        """Return the number of hours in a chunk for numPoints points."""
+        # Every value takes up its own size plus a byte for the boolean result of a comparison.
+        return max(30,self.memoryBudget//max(1,numPoints*(self.dtype.itemsize+1)))
+
+    def chunks(self):
+        """
+        Yield the months, dates, hours (with the correction of Dayill) and illuminance of a chunk of hours at a time.
+        The illuminance is an array of hours x points that is reused for the next chunk, so copy it if it needs to
+        be kept.
+        """
+        correction = timeSeries.HourCorrection()
+        block = None
+        months,dates,hours = [],[],[]
+        firstChunk = True
+
+        for month,date,hour,values in _illRows(self.illfile,self.extradata):
+            if block is None:
+                self.numPoints = len(values)
+                chunkHours = self.chunkHours(self.numPoints)
+                block = np.empty((min(chunkHours,24*31),self.numPoints),dtype=self.dtype)
+            elif len(hours) == len(block):
+                # The block starts with a month of hours and grows to a full chunk as the rows are read, so that a
+                # short file only takes up the memory of its rows. Nothing refers to the block before the first chunk is yielded, so it can be
+                # resized in place.
+                block.resize((min(2*len(block),chunkHours),self.numPoints),refcheck=False)
+            block[len(hours)] = values
+            months.append(month)
+            dates.append(date)
+            hours.append(hour)
+
+            if len(hours) == chunkHours:
+                correctedHours = correction.apply(hours)
+                if firstChunk and correction.firstHourFixed:
+                    correctedHours[0] = 0.5
+                yield months,dates,correctedHours,block
+                months,dates,hours = [],[],[]
+                firstChunk = False
+
+        if hours:
+            correctedHours = correction.apply(hours)
+            if firstChunk and correction.firstHourFixed:
+                correctedHours[0] = 0.5
+            yield months,dates,correctedHours,block[:len(hours)]
+
+    def bandCounts(self,bands,startTime=None,endTime=None,pointMask=None):
+        """
+        Count the hours for which the illuminance at each point lies within any number of bands. See
+        Dayill.bandCounts.
+
+        :return: A metrics.BandCounter.
+        """
+        counter = None
+        pointIndices = None
+        for _,_,hours,block in self.chunks():
+            if counter is None:
+                startTime,endTime = timeSeries.hourWindow(hours,startTime,endTime)
+                if pointMask is not None:
+                    pointIndices = _maskIndices(pointMask,self.numPoints)
+                counter = metrics.BandCounter(_countedBands(bands),
+                                              self.numPoints if pointIndices is None else len(pointIndices))
+
+            selected = (startTime<=hours)&(hours<=endTime)
+            if np.all(selected):
+                selectedBlock = block
+            else:
+                selectedBlock = block[selected]
+            if pointIndices is not None:
+                selectedBlock = selectedBlock[:,pointIndices]
+            counter.add(selectedBlock)
+
+        assert counter is not None, 'The ill file %s does not contain any hours.'%self.illfile
+        return counter
+
+    def pointsIlluminanceTimeSummary(self,illMin=None,illMax=None,startTime=None,endTime=None,returnPercent=False,
+                                     specificPoints=None,percentRoundOff=3,pointMask=None):
+        """
+        Return the number (or fraction) of hours for which the illuminance at each point lies between illMin and
+        illMax. See Dayill.pointsIlluminanceTimeSummary.
+        """
+        assert not ((illMin is None) and (illMax is None)),\
+            'Both illMin and illMax cannot be specified as None'
+
+        assert not ((illMin is False) or (illMax is False)),\
+            'illMin(%s) and illMax(%s) can either be an integer or None. They cannot be False.'%(illMin,illMax)
+
+        numPoints = self._pointsInFile()
+        specificPoints = _summaryPoints(specificPoints,pointMask,numPoints)
+        counter = self.bandCounts([_summaryBand(illMin,illMax)],startTime,endTime,specificPoints)
+        return _countsList(counter,0,returnPercent,percentRoundOff)
+
+    def metricsSummary(self,startTime=8,endTime=18,sdaThreshold=300,DA=0.5,aseThreshold=1000,aseHours=250,
+                       udiLow=100,udiHigh=2000,pointMask=None):
+        """
+        Calculate sDA, ASE and UDI together, with a single read of the file. See Dayill.metricsSummary.
+        """
+        counter = self.bandCounts(_metricBands(sdaThreshold,aseThreshold,udiLow,udiHigh),startTime,endTime,
+                                  pointMask)
+        return _metricsFromCounter(counter,DA,aseHours)
+
+    def hourlyStatistics(self):
+        """
+        :return: A dictionary containing arrays of the mean, maximum and minimum illuminance of every hour, and the
+            corrected hours.
+        """
+        statistics = {'mean':[],'max':[],'min':[],'hours':[]}
+        for _,_,hours,block in self.chunks():
+            statistics['mean'].append(block.mean(axis=1,dtype=np.float64))
+            statistics['max'].append(block.max(axis=1))
+            statistics['min'].append(block.min(axis=1))
+            statistics['hours'].append(hours)
+        return dict((key,np.concatenate(values)) for key,values in statistics.items())
+
+    def _pointsInFile(self):
+        """Return the number of points, from the first line of the ill file."""
+        if self.numPoints is None:
+            rows = _illRows(self.illfile,{})
+            for _,_,_,values in rows:
+                self.numPoints = len(values)
+                break
+            rows.close()
+        return self.numPoints
+
+
 if __name__ == "__main__":
     pass
\ No newline at end of file
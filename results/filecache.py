@@ -0,0 +1,105 @@
+"""
+    Helpers for storing parsed arrays next to the files that they were parsed from.
+
+    A cache is a directory containing one .npy file for every array and a meta.json file that records the path, size
+    and modification time of the source files. The cache is only used while these match the source files, and the
+    arrays are memory-mapped when they are read back.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import logging
+logger = logging.getLogger("__main__")
+logging.basicConfig(format='%(asctime)s -%(levelname)s module:%(module)s function:%(funcName)s message--%(message)s')
+
+import numpy as np
+
+
+def cachePath(sourceFile,suffix,cacheDir=None):
+    """
+    Return the path of the cache directory for a source file.
+
+    :param sourceFile: The file that the cached data was parsed from.
+    :param suffix: Suffix identifying the kind of data, for example '.ptscache'.
+    :param cacheDir: Directory in which the cache should be stored. If None (default), the cache is stored next to
+        the source file.
+    """
+    sourceFile = os.path.abspath(sourceFile)
+    if cacheDir is None:
+        return sourceFile+suffix
+
+    # Different directories can contain files with the same name, so add a hash of the full path.
+    pathHash = hashlib.md5(sourceFile).hexdigest()[:12]
+    return os.path.join(cacheDir,"%s_%s%s"%(os.path.basename(sourceFile),pathHash,suffix))
+
+
+def sourceSignature(sourceFiles):
+    """Return a list containing the path, size and modification time of the source files."""
+    signature = []
+    for sourceFile in sourceFiles:
+        fileStat = os.stat(sourceFile)
+        signature.append({'path':os.path.abspath(sourceFile),'size':fileStat.st_size,'mtime':fileStat.st_mtime})
+    return signature
+
+
+def readCache(cacheDirPath,sourceFiles,mmapMode='r'):
+    """
+    Return a dictionary of the cached arrays, or None if the cache does not exist or the source files have changed
+    since it was written.
+
+    :param cacheDirPath: Path of the cache directory, as returned by cachePath.
+    :param sourceFiles: List of the files that the cached data was parsed from.
+    :param mmapMode: Mode with which the arrays are memory-mapped. Set to None to read the arrays into memory.
+    """
+    metaFile = os.path.join(cacheDirPath,'meta.json')
+    if not os.path.exists(metaFile):
+        return None
+
+    try:
+        with open(metaFile) as metaData:
+            meta = json.load(metaData)
+        if meta['sources'] != sourceSignature(sourceFiles):
+            logger.info("The cache %s is out of date."%cacheDirPath)
+            return None
+        return dict((name,np.load(os.path.join(cacheDirPath,name+'.npy'),mmap_mode=mmapMode))
+                    for name in meta['arrays'])
+    except (IOError,OSError,ValueError,KeyError):
+        logger.warning("The cache %s could not be read and will be ignored."%cacheDirPath)
+        return None
+
+
+def writeCache(cacheDirPath,sourceFiles,arrays):
+    """
+    Write arrays to a cache directory. The arrays are written to a temporary directory first, which then replaces
+    any existing cache, so that a partially written cache is never read.
+
+    :param cacheDirPath: Path of the cache directory, as returned by cachePath.
+    :param sourceFiles: List of the files that the cached data was parsed from.
+    :param arrays: A dictionary of array names and arrays.
+    :return: cacheDirPath
+    """
+    parentDir = os.path.dirname(os.path.abspath(cacheDirPath))
+    if not os.path.exists(parentDir):
+        os.makedirs(parentDir)
+
+    tempDir = tempfile.mkdtemp(dir=parentDir,prefix='.tmpcache')
+    try:
+        for name,array in arrays.items():
+            np.save(os.path.join(tempDir,name+'.npy'),np.asarray(array))
+        with open(os.path.join(tempDir,'meta.json'),'w') as metaData:
+            json.dump({'sources':sourceSignature(sourceFiles),'arrays':sorted(arrays.keys())},metaData)
+
+        if os.path.exists(cacheDirPath):
+            shutil.rmtree(cacheDirPath)
+        os.rename(tempDir,cacheDirPath)
+    except:
+        shutil.rmtree(tempDir,ignore_errors=True)
+        raise
+
+    return cacheDirPath
@@ -10,13 +10,118 @@ logging.basicConfig(format='%(asctime)s -%(levelname)s module:%(module)s functio
 
 
 
-import sys as sys
-import operator as _op
+import numpy as np
 from pts import RoomGrid as _rmgrd
+from pts import RoomGridSet as _rmgrdset
+from pts import listFiles
+from radmatrix import readRadianceMatrix
+import parallel
 import warnings
 
 
 
+def filterMask(values,upper=None,lower=None):
+    """
+    Return a boolean array selecting illuminance values, as in Illarr.filterill. Values can have any shape, for
+    example hours x points.
+        If only upper is provided then select all values equal to and above upper
+        If only lower is provided then select all values equal to and below lower
+        If upper and lower are provided select all values within that range.
+    """
+    if not upper and not lower:
+        raise  Exception("No upper and lower values were specified for filtering illuminance values")
+
+    if upper and not lower:
+        return values>=upper
+    if not upper and lower:
+        return values<=lower
+    return (values>=lower)&(values<=upper)
+
+def filterDescription(numPoints,upper=None,lower=None):
+    """Return the description used as a key in the verbose output of Illarr.filterill."""
+    if upper and not lower:
+        return "Number of pts, out of a total {} pts, that are greater than or equal to {}".format(numPoints,upper)
+    if not upper and lower:
+        return "Number of pts, out of a total {} pts, that are lower than or equal to {}".format(numPoints,lower)
+    return "Number of pts, out of a total {} pts, that between {} and {}".format(numPoints,upper,lower)
+
+
+class IllStatistics(object):
+    """
+    Statistics of illuminance values for a single set of points, or for every row of a 2d array such as hours x
+    points. The mean, minimum, maximum, uniformity ratios and percentiles are calculated together, a block of rows
+    at a time, so that the values are only read from memory once. The points at the minimum and maximum, and their
+    ids, are found only when they are asked for.
+    """
+    # Number of values that are processed together. 2**18 doubles fit in a typical L2 cache.
+    blockSize = 2**18
+
+    def __init__(self,values,roomgrid=None,percentiles=()):
+        """
+        :param values: An array of illuminance values for the points, or a 2d array with a row of point values
+            for every hour.
+        :param roomgrid: The RoomGrid of the points. This is only needed for the point ids.
+        :param percentiles: Percentiles (between 0 and 100) to be calculated. Defaults to none.
+        """
+        self.values = np.asarray(values)
+        self.roomgrid = roomgrid
+        self.percentileValues = tuple(percentiles)
+
+        rows = self.values.reshape(-1,self.values.shape[-1])
+        numRows = len(rows)
+        self.mean = np.empty(numRows)
+        self.min = np.empty(numRows)
+        self.max = np.empty(numRows)
+        self.percentiles = np.empty((len(self.percentileValues),numRows))
+
+        blockRows = max(1,self.blockSize//max(1,rows.shape[1]))
+        for start in range(0,numRows,blockRows):
+            block = rows[start:start+blockRows]
+            self.mean[start:start+blockRows] = block.mean(axis=1,dtype=np.float64)
+            self.min[start:start+blockRows] = block.min(axis=1)
+            self.max[start:start+blockRows] = block.max(axis=1)
+            if self.percentileValues:
+                self.percentiles[:,start:start+blockRows] = np.percentile(block,self.percentileValues,axis=1)
+
+        if self.values.ndim == 1:
+            self.mean,self.min,self.max = self.mean[0],self.min[0],self.max[0]
+            self.percentiles = self.percentiles[:,0]
+
+        with np.errstate(divide='ignore',invalid='ignore'):
+            self.avMax = self.mean/self.max
+            self.avMin = self.mean/self.min
+            self.maxMin = self.max/self.min
+
+    def percentile(self,value):
+        """Return a percentile that was specified when the statistics were calculated."""
+        return self.percentiles[self.percentileValues.index(value)]
+
+    def _row(self,row):
+        if self.values.ndim == 1:
+            return self.values,self.min,self.max
+        return self.values[row],self.min[row],self.max[row]
+
+    def maxPoints(self,row=None):
+        """Return the indices of the points at the maximum illuminance (of a row, for 2d values)."""
+        values,_,maxval = self._row(row)
+        return np.flatnonzero(values==maxval)
+
+    def minPoints(self,row=None):
+        """Return the indices of the points at the minimum illuminance (of a row, for 2d values)."""
+        values,minval,_ = self._row(row)
+        return np.flatnonzero(values==minval)
+
+    def maxPointIds(self,row=None):
+        """Return the ptids of the points at the maximum illuminance."""
+        ptsdict = self.roomgrid.ptsdict
+        return [ptsdict[pt].ptid for pt in self.maxPoints(row)]
+
+    def minPointIds(self,row=None):
+        """Return the ptids of the points at the minimum illuminance."""
+        ptsdict = self.roomgrid.ptsdict
+        return [ptsdict[pt].ptid for pt in self.minPoints(row)]
+
+
 class Illarr(object):
 
     def __init__(self,illarr,roomgrid,vector=[0,0,1]):
@@ -24,6 +129,10 @@ class Illarr(object):
             This class is a definition of the illuminance profile of a room/space.
             To be constructed, it needs illvalues and a corresponding points grid.
             Notes to self: Don't create zone inside this...create zone outside..
+
+            The illuminance values are stored in a numpy array (illarr). Arithmetic with +,-,* and / returns a new
+            Illarr and leaves the operands unchanged. The other operand can be another Illarr, a scalar or an
+            array with a value for every point. Use +=, -=, *= and /= to change the values of an Illarr in place.
         """
         self.illarr = self.createIllArr(illarr)
         self.roomgrid = roomgrid
@@ -33,30 +142,46 @@ class Illarr(object):
 
     def createIllArr(self,illarr):
         fileContainsText=False
-        try:
+        if isinstance(illarr,basestring):
             # If a pts file is not provided assume that this is a zone ill file.
             # So read value into an array.
             #Update 7th Sep 2016: Added a functionality where illuminance files containing
             # headers, like the ones produced by rmtxop, can also be read.
-            with open(illarr)as illfile:
-                illarr = []
-                for lines in illfile:
-                    lineSplit = lines.strip().split()
-                    if lineSplit:
-                        try:
-                            illarr.append(float(lineSplit[-1]))
-                        except ValueError:
-                            fileContainsText = True
-        except:
-            illarr = illarr
+            illFilePath = illarr
+            try:
+                illarr = readRadianceMatrix(illFilePath)[1]
+                illarr = illarr.reshape(len(illarr),-1)[:,-1].astype(np.float64)
+            except ValueError:
+                # Files with text outside the header, or rows of different lengths, are read line by line.
+                with open(illFilePath)as illfile:
+                    illarr = []
+                    for lines in illfile:
+                        lineSplit = lines.strip().split()
+                        if lineSplit:
+                            try:
+                                illarr.append(float(lineSplit[-1]))
+                            except ValueError:
+                                fileContainsText = True
 
         if fileContainsText:
             msg = "\nThe file contains text in addition to numbers. The size of the number" \
                   "array is %s" % (len(illarr))
             warnings.warn(msg)
 
+        # Arrays of floats, for example a row of the hourly data of Dayill, are used without copying.
+        illarr = np.asarray(illarr)
+        if illarr.dtype.kind != 'f':
+            illarr = illarr.astype(np.float64)
+
         return illarr
 
+    @staticmethod
+    def _operand(other):
+        """Return the values of the other operand of an arithmetic operation."""
+        if isinstance(other,Illarr):
+            return other.illarr
+        return np.asarray(other)
+
     def __add__(self, other):
         """
             Operator overloading for addition
@@ -64,65 +189,104 @@ class Illarr(object):
             Addition shouldn't be allowed to mutate an existing zone.
             So, any addition, subtraction multiplication etc. should return a new Illarr.
         """
-        try:
-
-            self.illarr = map(_op.add,self.illarr,other.illarr)
+        return Illarr(self.illarr+self._operand(other),self.roomgrid)
 
-        except:
-            print(sys.exc_info())
-        return self
+    __radd__ = __add__
 
     def __sub__(self, other):
         """
-            Operator overloading for addition
-            Addition of two illarrays results in the creation of a newillarry with the
-            added illuminance
+            Operator overloading for subtraction
+            Subtraction of two illarrays results in the creation of a newillarry with the
+            subtracted illuminance
         """
-        try:
-            self.illarr = map(_op.sub,self.illarr,other.illarr)
-        except:
-            print(sys.exc_info())
+        return Illarr(self.illarr-self._operand(other),self.roomgrid)
 
-        return self
+    def __rsub__(self, other):
+        return Illarr(self._operand(other)-self.illarr,self.roomgrid)
 
     def __mul__(self, other):
         """
             Operator overloading for multiplication
-            Multiply illuminance values with a scalar quantity.
+            Multiply illuminance values with a scalar quantity, a factor for every point or another Illarr.
+        """
+        return Illarr(self.illarr*self._operand(other),self.roomgrid)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
         """
-        try:
-           self.illarr = map(_op.mul,self.illarr,[other]*len(self.illarr))
-        except:
-            print(sys.exc_info())
+            Operator overloading for division
+            Divide illuminance values by a scalar quantity, a factor for every point or another Illarr.
+        """
+        return Illarr(self.illarr/self._operand(other),self.roomgrid)
+
+    __div__ = __truediv__
 
+    def __iadd__(self, other):
+        """In place addition. Note that this changes any data that self.illarr is a view of."""
+        self.illarr += self._operand(other)
         return self
 
+    def __isub__(self, other):
+        """In place subtraction. Note that this changes any data that self.illarr is a view of."""
+        self.illarr -= self._operand(other)
+        return self
+
+    def __imul__(self, other):
+        """In place multiplication. Note that this changes any data that self.illarr is a view of."""
+        self.illarr *= self._operand(other)
+        return self
+
+    def __itruediv__(self, other):
+        """In place division. Note that this changes any data that self.illarr is a view of."""
+        self.illarr /= self._operand(other)
+        return self
+
+    __idiv__ = __itruediv__
+
+
+    def statistics(self,percentiles=()):
+        """
+        Return an IllStatistics with the mean, minimum, maximum, uniformity ratios and the specified percentiles
+        (between 0 and 100) of the illuminance.
+        """
+        return IllStatistics(self.illarr,self.roomgrid,percentiles)
 
     @property
     def max_ill(self):
-        maxval = max(self.illarr)
-        maxpts = [idx for idx,val in enumerate(self.illarr) if val==maxval]
-        maxpts = [ self.roomgrid.ptsdict[pt].ptid for pt in maxpts ]
-        return {'max_ill':maxval,"points":maxpts}
+        stats = self.statistics()
+        return {'max_ill':float(stats.max),"points":stats.maxPointIds()}
 
     @property
     def min_ill(self):
-        minval = min(self.illarr)
-        minpts = [idx for idx,val in enumerate(self.illarr) if val==minval]
-        minpts = [ self.roomgrid.ptsdict[pt].ptid for pt in minpts ]
-        return {'min_ill':minval,"points":minpts}
+        stats = self.statistics()
+        return {'min_ill':float(stats.min),"points":stats.minPointIds()}
 
     @property
     def summary(self):
-        try:
-            ave_val = sum(self.illarr)/len(self.illarr)
-            ave_max = ave_val/self.max_ill['max_ill']
-            ave_min = ave_val/self.min_ill['min_ill']
-            max_min = ave_min/ave_max
-            return {"av_ill":round(ave_val,2),"av_ill/max":round(ave_max,2),"av_ill/min":round(ave_min,2),"max/min":round(max_min,2)}
-        except ZeroDivisionError:
+        stats = self.statistics()
+        ave_val,maxval,minval = float(stats.mean),float(stats.max),float(stats.min)
+        if not (ave_val and maxval and minval):
             return {"av_ill":0,"av_ill/max":None,"av_ill/min":None,"max/min":None}
+        return {"av_ill":round(ave_val,2),"av_ill/max":round(ave_val/maxval,2),"av_ill/min":round(ave_val/minval,2),
+                "max/min":round(maxval/minval,2)}
+
+
+    def filterMask(self,upper=None,lower=None):
+        """Return a boolean array that is True for the points selected by filterill."""
+        return filterMask(self.illarr,upper,lower)
+
+    def filterIndices(self,upper=None,lower=None):
+        """Return the indices of the points selected by filterill."""
+        return np.flatnonzero(self.filterMask(upper,lower))
 
+    def filterCount(self,upper=None,lower=None):
+        """Return the number of points selected by filterill."""
+        return int(np.count_nonzero(self.filterMask(upper,lower)))
+
+    def filterFraction(self,upper=None,lower=None):
+        """Return the fraction of points selected by filterill."""
+        return self.filterCount(upper,lower)/len(self.illarr)
 
     def filterill(self,upper=None,lower=None,listpts=False,verbose=True,percent=False):
         """
@@ -130,62 +294,135 @@ class Illarr(object):
             If only lower is provided then list all points equal to and below lower
             If upper and lower are provided list all points within that range.
             if listpts is True then list all the points for that particular option.
-        """
-        if not upper and not lower:
-            raise  Exception("No upper and lower values were specified for filtering illuminance values")
-
-        if upper and not lower:
 
-            pts = [{'ptid': self.roomgrid.ptsdict[idx].ptid,'illval':illval,'ptobj':self.roomgrid.ptsdict[idx]} for idx,illval in enumerate(self.illarr) if illval>=upper]
-            ptsnum = len(pts)
-            if verbose:
-                if listpts:
-                    return {"Number of pts, out of a total {} pts, that are greater than or equal to {}".format(len(self.illarr),upper):ptsnum,"List of points":pts}
-                else:
-                    return {"Number of pts, out of a total {} pts, that are greater than or equal to {}".format(len(self.illarr),upper):ptsnum}
-            elif percent:
-                return round(ptsnum/len(self.illarr),3)
+            The points are counted from a boolean mask. The list of points is only created if listpts is True. Use
+            filterMask, filterIndices, filterCount and filterFraction to get the selected points as arrays.
+        """
+        ptsnum = self.filterCount(upper,lower)
+
+        if verbose:
+            description = filterDescription(len(self.illarr),upper,lower)
+            if listpts:
+                ptsdict = self.roomgrid.ptsdict
+                pts = []
+                for idx in self.filterIndices(upper,lower).tolist():
+                    ptobj = ptsdict[idx]
+                    pts.append({'ptid':ptobj.ptid,'illval':float(self.illarr[idx]),'ptobj':ptobj})
+                return {description:ptsnum,"List of points":pts}
             else:
-                return ptsnum
+                return {description:ptsnum}
+        elif percent:
+            return round(ptsnum/len(self.illarr),3)
+        else:
+            return ptsnum
+
+def readZoneFile(zonefile,vector=(0,0,1)):
+    """
+    Read a zone file, or an rtrace result file containing the points, in a single pass.
+
+    The first three values of a line are the coordinates of the point and the last value is the illuminance. As in
+    RoomGrid, the vector of a point is read from the line if it contains 6 values, otherwise vector is used.
+
+    :return: A N x 6 array of x,y,z,vx,vy,vz values and an array of the N illuminance values.
+    """
+    try:
+        data = readRadianceMatrix(zonefile)[1]
+        data = data.reshape(len(data),-1)
+    except ValueError:
+        # The lines have different lengths, so read them one by one.
+        data = None
+
+    if data is not None:
+        assert data.shape[1]>=3, 'The lines of the zone file %s should contain at least 3 values.'%zonefile
+        ptsarr = np.empty((len(data),6))
+        ptsarr[:,:3] = data[:,:3]
+        ptsarr[:,3:] = data[:,3:6] if data.shape[1]==6 else vector
+        return ptsarr,data[:,-1].astype(np.float64)
+
+    ptsrows,values = [],[]
+    with open(zonefile) as zonedata:
+        for lines in zonedata:
+            linesnum = map(float,lines.split())
+            if linesnum:
+                ptsrows.append(linesnum if len(linesnum)==6 else linesnum[:3]+list(vector))
+                values.append(linesnum[-1])
+    return np.array(ptsrows,dtype=np.float64).reshape(-1,6),np.array(values,dtype=np.float64)
 
-        if not upper and lower:
 
-            pts = [{'ptid': self.roomgrid.ptsdict[idx].ptid,'illval':illval,'ptobj':self.roomgrid.ptsdict[idx]} for idx,illval in enumerate(self.illarr) if illval<=lower]
-            ptsnum = len(pts)
+class Zoneill(Illarr):
+    """This class can be used to read Data from electric zones and also data from
+    daylight rtrace results that contain pts info.."""
 
-            if verbose:
-                if listpts:
-                    return {"Number of pts, out of a total {} pts, that are lower than or equal to {}".format(len(self.illarr),lower):ptsnum,"List of points":pts}
-                else:
-                    return {"Number of pts, out of a total {} pts, that are lower than or equal to {}".format(len(self.illarr),lower):ptsnum}
-            elif percent:
-                return round(ptsnum/len(self.illarr),3)
-            else:
-                return ptsnum
+    def __init__(self,zonefile):
+        ptsarr,illarr = readZoneFile(zonefile)
+        self.roomgrid = _rmgrd.fromArray(ptsarr)
+        Illarr.__init__(self,illarr,self.roomgrid)
+
+    @classmethod
+    def fromArrays(cls,illarr,roomgrid):
+        """Create a zoneill from an array of illuminance values and the roomgrid of the points."""
+        zoneill = cls.__new__(cls)
+        Illarr.__init__(zoneill,illarr,roomgrid)
+        return zoneill
+
+
+class ZoneillSet(object):
+    """
+    A collection of zoneills, for example the results of all the luminaire runs of a floor. The points of all the
+    zones are stored in a RoomGridSet (roomgridset) and the illuminance values in one array (illarr), with the values
+    of zone i between roomgridset.offsets[i] and roomgridset.offsets[i+1]. Indexing the set returns a Zoneill that
+    is a view of a single zone.
+    """
+    def __init__(self,zonefiles,pattern='*',processes=1):
+        """
+        :param zonefiles: A directory containing zone files, a manifest file listing the paths of zone files (one
+            per line, relative to the manifest), or a list of paths.
+        :param pattern: Pattern for selecting the zone files in a directory. Defaults to all files.
+        :param processes: Number of processes used for reading the files. Defaults to 1, which reads the files in
+            this process. Set this to None to use a process for every cpu. See parallel.mapInPool.
+        """
+        zonefiles = listFiles(zonefiles,pattern)
+        assert zonefiles, 'No zone files were found.'
 
-        if upper and lower:
+        zoneArrays = parallel.mapInPool(readZoneFile,zonefiles,processes)
+        self.roomgridset = _rmgrdset.fromArrays([ptsarr for ptsarr,_ in zoneArrays],zonefiles)
+        self.illarr = np.concatenate([illarr for _,illarr in zoneArrays])
+        self._zoneills = [None]*len(zonefiles)
 
-            pts = [{'ptid': self.roomgrid.ptsdict[idx].ptid,'illval':illval,'ptobj':self.roomgrid.ptsdict[idx]} for idx,illval in enumerate(self.illarr) if illval>=lower and illval<=upper]
-            ptsnum = len(pts)
+    @property
+    def zonefiles(self):
+        return self.roomgridset.ptsfiles
 
-            if verbose:
-                if listpts:
-                    return {"Number of pts, out of a total {} pts, that between {} and {}".format(len(self.illarr),upper,lower):ptsnum,"List of points":pts}
-                else:
-                    return {"Number of pts, out of a total {} pts, that between {} and {}".format(len(self.illarr),upper,lower):ptsnum}
-            elif percent:
-                return round(ptsnum/len(self.illarr),3)
-            else:
-                return ptsnum
+    def __len__(self):
+        return len(self.roomgridset)
 
-class Zoneill(Illarr):
-    """This class can be used to read Data from electric zones and also data from
-    daylight rtrace results that contain pts info.."""
+    def __getitem__(self,zone):
+        """Return the Zoneill of a zone, which is a view of the shared arrays."""
+        if self._zoneills[zone] is None:
+            offsets = self.roomgridset.offsets
+            self._zoneills[zone] = Zoneill.fromArrays(self.illarr[offsets[zone]:offsets[zone+1]],
+                                                      self.roomgridset[zone])
+        return self._zoneills[zone]
 
-    def __init__(self,zonefile):
-        self.roomgrid = _rmgrd(zonefile)
-        Illarr.__init__(self,zonefile,self.roomgrid)
+    def __iter__(self):
+        return (self[zone] for zone in range(len(self)))
+
+    def valueMatrix(self):
+        """
+        :return: A zones x points array of the illuminance values, for zones that were calculated on the same
+            points, for example the runs of different luminaires in one room.
+        """
+        numPoints = self.roomgridset.numPoints
+        assert np.all(numPoints==numPoints[0]), 'All the zones should have the same number of points.'
+        return self.illarr.reshape(len(self),-1)
 
+    def zoneStatistics(self):
+        """
+        :return: Arrays containing the mean, minimum and maximum illuminance of every zone.
+        """
+        starts = self.roomgridset.offsets[:-1]
+        return (np.add.reduceat(self.illarr,starts)/self.roomgridset.numPoints,
+                np.minimum.reduceat(self.illarr,starts),np.maximum.reduceat(self.illarr,starts))
 
 
 if __name__ ==  '__main__':
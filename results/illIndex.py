@@ -0,0 +1,163 @@
+"""
+    Random access to the rows of a Daysim format ill file.
+
+    The byte offsets of the rows are found once, with a buffered scan for newlines, and can be stored in a sidecar
+    cache next to the ill file (see filecache) along with the months, dates and hours of the rows. Particular hours,
+    days or months can then be read by seeking to their rows and parsing only those. The offsets are also used to
+    divide a file into byte ranges that begin and end at rows, for parsing parts of a file in parallel.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import numpy as np
+import filecache
+import timeSeries
+
+# The number of bytes at the beginning of a line that are read to find its month, date and hour.
+_prefixBytes = 256
+
+
+def _scanRows(illfile):
+    """
+    Return the starts and ends of the data rows of an ill file, with their months, dates and (uncorrected) hours,
+    and a dictionary of the lines that contain text, as in timeSeries.TimeArray.
+    """
+    starts,ends = timeSeries.lineOffsets(illfile)
+    rows = np.zeros(len(starts),dtype=bool)
+    months,dates,hours = [],[],[]
+    extradata = {}
+
+    with open(illfile,'rb') as illText:
+        for idx,(start,end) in enumerate(zip(starts.tolist(),ends.tolist())):
+            illText.seek(start)
+            lineSplit = illText.read(min(end-start,_prefixBytes)).decode('ascii','replace').split(None,3)
+            if not lineSplit:
+                continue
+            try:
+                try:
+                    month,date,hour = int(lineSplit[0]),int(lineSplit[1]),float(lineSplit[2])
+                except ValueError:
+                    month,date,hour = float(lineSplit[0]),float(lineSplit[1]),float(lineSplit[2])
+            except (ValueError,IndexError):
+                if len(lineSplit)>1:
+                    extradata[lineSplit[0]] = lineSplit[1]
+                continue
+            rows[idx] = True
+            months.append(month)
+            dates.append(date)
+            hours.append(hour)
+
+    return starts[rows],ends[rows],months,dates,hours,extradata
+
+
+class IllRowIndex(object):
+    """
+    Byte offsets and timestamps of the rows of a Daysim format ill file, for reading some of its rows without
+    parsing the rest of the file. For example, IllRowIndex(illfile,useCache=True).illuminanceDataMonthly(6) reads
+    only the rows of June, and the next index of the same file is read from the cache. The values are the same as
+    those in Dayill.illData.
+    """
+    def __init__(self,illfile,useCache=False,cacheDir=None):
+        """
+        :param illfile: A time series file of illuminance values in Daysim format.
+        :param useCache: Set this to True to store the index in a sidecar cache next to the ill file (or in
+            cacheDir), and read it from there as long as the size and modification time of the ill file do not
+            change. Defaults to False, as in Dayill.
+        :param cacheDir: Directory for the cache. Defaults to the directory of the ill file.
+        """
+        self.illfile = illfile
+
+        cachedArrays = None
+        if useCache:
+            cacheDirPath = filecache.cachePath(illfile,'.rowindex',cacheDir)
+            cachedArrays = filecache.readCache(cacheDirPath,[illfile],mmapMode=None)
+
+        if cachedArrays is None:
+            starts,ends,months,dates,hours,extradata = _scanRows(illfile)
+            cachedArrays = {'starts':starts,'ends':ends,'month':np.array(months),'day':np.array(dates),
+                            'hour':np.array(hours,dtype=np.float64),
+                            'extradata':np.array(sorted(extradata.items()),dtype=str).reshape(-1,2)}
+            if useCache:
+                filecache.writeCache(cacheDirPath,[illfile],cachedArrays)
+
+        self.starts = cachedArrays['starts']
+        self.ends = cachedArrays['ends']
+        self.extradata = dict(cachedArrays['extradata'].tolist())
+
+        hours,self.firstHourFixed = timeSeries.fixHours(cachedArrays['hour'])
+        self.timeIndex = timeSeries.TimeIndex(cachedArrays['month'],cachedArrays['day'],hours)
+        self._numPoints = None
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def numPoints(self):
+        """:return: The number of values in the first row of the file."""
+        if self._numPoints is None:
+            self._numPoints = self.readRows([0]).shape[1] if len(self) else 0
+        return self._numPoints
+
+    def readRows(self,rows,points=None,dtype=np.float64):
+        """
+        Read some rows of the file. Consecutive rows are read together.
+
+        :param rows: An index, a slice or an array of the indices of the rows (as returned by the select methods of
+            timeIndex).
+        :param points: The indices of the points to be read, starting from 0. Defaults to all the points.
+        :param dtype: Data type of the values. Defaults to float64.
+        :return: An array of rows x points.
+        """
+        rows = np.arange(len(self))[rows].reshape(-1)
+        values = None
+        numPoints = None
+        filled = 0
+
+        runStarts = np.flatnonzero(np.diff(rows) != 1)+1
+        with open(self.illfile,'rb') as illText:
+            for run in (np.split(rows,runStarts) if len(rows) else []):
+                base = self.starts[run[0]]
+                illText.seek(base)
+                text = illText.read(self.ends[run[-1]]-base)
+                for row in run.tolist():
+                    lineSplit = text[self.starts[row]-base:self.ends[row]-base].decode('ascii').split(None,3)
+                    rowValues = np.fromstring(lineSplit[3] if len(lineSplit)>3 else '',dtype=np.float64,sep=' ')
+                    if values is None:
+                        numPoints = len(rowValues)
+                        values = np.empty((len(rows),numPoints if points is None else len(points)),dtype=dtype)
+                    assert len(rowValues) == numPoints, 'The row %s of %s has %s values instead of ' \
+                                                        '%s.'%(row,self.illfile,len(rowValues),numPoints)
+                    values[filled] = rowValues if points is None else rowValues[points]
+                    filled += 1
+
+        if values is None:
+            values = np.empty((0,0 if points is None else len(points)),dtype=dtype)
+        return values
+
+    def illuminanceDataHOY(self,hour):
+        """Return the illuminance values of the row with the index hour (0 to 8759 for a full year)."""
+        assert 0 <= hour < len(self),'The hour(%s) should be between 0 and %s.'%(hour,len(self)-1)
+        return self.readRows(hour)[0]
+
+    def illuminanceDataMonthly(self,month):
+        """Return the illuminance values of the rows of a month, as an array of hours x points."""
+        return self.readRows(self.timeIndex.selectMonth(month))
+
+    def illuminanceDataHourly(self,hour):
+        """Return the illuminance values at a particular hour (0 to 23) of every day, as an array of hours x points."""
+        return self.readRows(self.timeIndex.selectHourOfDay(hour))
+
+    def illuminanceDataDaily(self,month,day):
+        """Return the illuminance values of the rows of a date, as an array of hours x points."""
+        return self.readRows(self.timeIndex.selectDate(month,day))
+
+    def byteRanges(self,parts):
+        """
+        Divide the rows into parts with about the same number of bytes. See timeSeries.byteRanges.
+
+        :param parts: The number of parts. Fewer parts are returned if there are fewer rows.
+        :return: A list of (firstRow,stopRow,startByte,endByte) for every part. The bytes from startByte to endByte
+            contain the rows from firstRow up to stopRow, along with any lines of text between them.
+        """
+        return timeSeries.byteRanges(self.starts,self.ends,parts)
@@ -0,0 +1,328 @@
+"""
+    Counting the hours for which the illuminance at each point lies within one or more bands.
+
+    sDA, ASE and UDI are all counts of hours per point above, below or between thresholds. BandCounter evaluates any
+    number of bands together: every distinct threshold is compared once with a block of hours, and the count of every
+    band is the difference of two threshold counts. Blocks of hours can be added one at a time, so the data does not
+    need to be in memory at once.
+
+    ThresholdSweep sorts the values of every point once, so that sDA, ASE and UDI can then be evaluated for any number
+    of thresholds and fractions without going over the data again.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import sys
+import time
+
+import numpy as np
+
+
+class BandCounter(object):
+    """
+    Count the hours for which the illuminance at each point lies within a set of bands.
+    """
+    def __init__(self,bands,numPoints):
+        """
+        :param bands: A list of (lower,upper) limits. Both limits are included in the band, as in
+            Dayill.pointsIlluminanceTimeSummary. Set a limit to None to leave that side of the band open.
+        :param numPoints: The number of points.
+        """
+        self.bands = [tuple(band) for band in bands]
+        assert all(len(band) == 2 and band != (None,None) for band in self.bands), \
+            'Each band should be a (lower,upper) pair with at least one limit.'
+
+        self.numPoints = numPoints
+        self.hours = 0
+
+        # A band [lower,upper] contains the hours >= lower minus the hours > upper.
+        thresholds = set(('>=',lower) for lower,_ in self.bands if lower is not None)
+        thresholds.update(('>',upper) for _,upper in self.bands if upper is not None)
+        self.thresholds = sorted(thresholds)
+        self.thresholdCounts = np.zeros((len(self.thresholds),numPoints),dtype=np.int64)
+
+    def add(self,block):
+        """
+        Add the counts of a block of hours.
+
+        :param block: An array of hours x points.
+        """
+        block = np.asarray(block)
+        if block.ndim == 1:
+            block = block.reshape(1,-1)
+        assert block.shape[1] == self.numPoints, \
+            'The block has %s points instead of %s.'%(block.shape[1],self.numPoints)
+
+        for idx,(operator,threshold) in enumerate(self.thresholds):
+            if operator == '>=':
+                self.thresholdCounts[idx] += np.count_nonzero(block >= threshold,axis=0)
+            else:
+                self.thresholdCounts[idx] += np.count_nonzero(block > threshold,axis=0)
+        self.hours += len(block)
+        return self
+
+    def merge(self,other):
+        """Add the counts of another BandCounter with the same bands and points, for example for other hours."""
+        assert other.thresholds == self.thresholds and other.numPoints == self.numPoints, \
+            'Only counters with the same bands and number of points can be merged.'
+        self.thresholdCounts += other.thresholdCounts
+        self.hours += other.hours
+        return self
+
+    @classmethod
+    def concatenate(cls,counters):
+        """
+        Join BandCounters of the same bands and hours that counted different points, for example the partitions of
+        a parallel count, into one counter with the points in the order of counters.
+        """
+        counters = list(counters)
+        assert counters, 'At least one counter is needed.'
+        assert all(counter.thresholds == counters[0].thresholds and counter.hours == counters[0].hours
+                   for counter in counters), 'Only counters with the same bands and hours can be joined.'
+        joined = cls(counters[0].bands,sum(counter.numPoints for counter in counters))
+        joined.thresholdCounts = np.hstack([counter.thresholdCounts for counter in counters])
+        joined.hours = counters[0].hours
+        return joined
+
+    def _thresholdCount(self,operator,threshold):
+        return self.thresholdCounts[self.thresholds.index((operator,threshold))]
+
+    @property
+    def counts(self):
+        """:return: An array of bands x points containing the number of hours in each band."""
+        counts = np.empty((len(self.bands),self.numPoints),dtype=np.int64)
+        for idx,(lower,upper) in enumerate(self.bands):
+            atLeastLower = self.hours if lower is None else self._thresholdCount('>=',lower)
+            aboveUpper = 0 if upper is None else self._thresholdCount('>',upper)
+            # An empty band (lower > upper) has no hours.
+            counts[idx] = np.maximum(atLeastLower-aboveUpper,0)
+        return counts
+
+    @property
+    def fractions(self):
+        """:return: An array of bands x points containing the fraction of the hours in each band."""
+        return self.counts/self.hours
+
+
+def countBands(data,bands,hourIndices=None,pointIndices=None,blockHours=None):
+    """
+    Count the hours for which the illuminance at each point lies within a set of bands.
+
+    :param data: An array of hours x points, for example Dayill.illData.
+    :param bands: A list of (lower,upper) limits, see BandCounter.
+    :param hourIndices: The hours to be counted. Defaults to all the hours.
+    :param pointIndices: The points to be counted, in the order in which they should be returned. Defaults to all the
+        points.
+    :param blockHours: The number of hours compared at a time. Defaults to a block of about 4 million values.
+    :return: A BandCounter.
+    """
+    hourIndices = np.arange(len(data)) if hourIndices is None else np.asarray(hourIndices,dtype=np.intp)
+    numPoints = data.shape[1] if pointIndices is None else len(pointIndices)
+    counter = BandCounter(bands,numPoints)
+
+    if pointIndices is not None and len(pointIndices) and \
+            np.array_equal(pointIndices,np.arange(pointIndices[0],pointIndices[0]+len(pointIndices))):
+        # Consecutive points are sliced, so that only their part of each row is read.
+        pointIndices = slice(pointIndices[0],pointIndices[0]+len(pointIndices))
+
+    blockHours = blockHours or max(1,(1<<22)//max(1,numPoints))
+    for start in range(0,len(hourIndices),blockHours):
+        hours = hourIndices[start:start+blockHours]
+        if hours[-1]-hours[0] == len(hours)-1 and np.all(np.diff(hours) == 1):
+            # Consecutive hours are sliced, which does not copy them.
+            block = data[hours[0]:hours[-1]+1]
+        else:
+            block = data[hours]
+        if pointIndices is not None:
+            block = block[:,pointIndices]
+        counter.add(block)
+
+    return counter
+
+
+def _roundedFractionCount(numHours,fraction,percentRoundOff=3):
+    """
+    Return the smallest number of hours (out of numHours) for which round(hours/numHours,percentRoundOff) >= fraction,
+    which is how Dayill.metricSDA compares the fraction of hours of a point with DA, or numHours+1 if there is none.
+    """
+    hours = np.arange(numHours+1)
+    rounded = np.array([round(count/numHours,percentRoundOff) for count in hours.tolist()])
+    enough = np.flatnonzero(rounded >= fraction)
+    return int(hours[enough[0]]) if len(enough) else numHours+1
+
+
+class ThresholdSweep(object):
+    """
+    The illuminance values of every point, sorted once, for evaluating sDA, ASE and UDI at many thresholds.
+
+    A point has at least k hours at or above a threshold if its k-th largest value is at or above the threshold. So
+    for a given number of hours k, the k-th largest value of every point is sorted once (a quantile row), and the
+    number of points that pass any threshold is then found with a binary search. The results are the same as those of
+    Dayill.metricSDA, metricASE and metricUDIdetailed.
+
+    The sorted values take as much memory as the data of the selected hours and points. The UDI queries also sort all
+    the values together the first time that they are used, which takes the same amount of memory again.
+    """
+    def __init__(self,data):
+        """
+        :param data: An array of hours x points containing the illuminance of the selected hours, for example
+            Dayill.illData[hours]. The array is sorted in place, so pass a copy if it is still needed.
+        """
+        data = np.asarray(data)
+        assert data.ndim == 2 and data.size, 'The data should be a non-empty array of hours x points.'
+        data.sort(axis=0)
+
+        self.sortedValues = data
+        self.numHours,self.numPoints = data.shape
+        self._quantileRows = {}
+        self._fractionCounts = {}
+        self._pooledValues = None
+
+    def _threshold(self,threshold):
+        # Compare in the type of the data, as the comparisons of BandCounter do.
+        return self.sortedValues.dtype.type(threshold)
+
+    def quantileRow(self,hours):
+        """
+        :param hours: A number of hours.
+        :return: A sorted array containing, for every point, the value that it reaches or exceeds for the given number
+            of hours. Points with at least hours at or above a threshold are the ones whose value in this row is at or
+            above the threshold.
+        """
+        hours = int(hours)
+        if hours not in self._quantileRows:
+            self._quantileRows[hours] = np.sort(self.sortedValues[self.numHours-hours])
+        return self._quantileRows[hours]
+
+    def _fractionOfPoints(self,hours,threshold):
+        """Return the fraction of points that have at least hours at or above threshold."""
+        if hours <= 0:
+            return 1.0
+        if hours > self.numHours:
+            return 0.0
+        row = self.quantileRow(hours)
+        return float(self.numPoints-np.searchsorted(row,self._threshold(threshold),side='left'))/self.numPoints
+
+    def hoursAtOrAbove(self,threshold):
+        """
+        :return: An array containing the number of hours for which the illuminance at every point is at or above
+            threshold, found with a binary search of the sorted values of all the points together.
+        """
+        threshold = self._threshold(threshold)
+        columns = np.arange(self.numPoints)
+        low = np.zeros(self.numPoints,dtype=np.intp)
+        high = np.full(self.numPoints,self.numHours,dtype=np.intp)
+        while True:
+            searching = low<high
+            if not np.any(searching):
+                break
+            middle = (low+high)//2
+            below = self.sortedValues[np.minimum(middle,self.numHours-1),columns] < threshold
+            low = np.where(searching&below,middle+1,low)
+            high = np.where(searching&~below,middle,high)
+        return self.numHours-low
+
+    def sDA(self,threshold=300,DA=0.5):
+        """The fraction of points whose fraction of hours at or above threshold, rounded to 3 digits, is at least DA."""
+        if DA not in self._fractionCounts:
+            self._fractionCounts[DA] = _roundedFractionCount(self.numHours,DA)
+        hours = self._fractionCounts[DA]
+        if not threshold:
+            # A threshold of 0 counts no hours, as in Dayill.pointsIlluminanceTimeSummary.
+            hours = 0 if hours <= 0 else self.numHours+1
+        return self._fractionOfPoints(hours,threshold)
+
+    def ASE(self,threshold=1000,hours=250):
+        """The fraction of points that are above threshold (at or above threshold+1) for more than hours."""
+        hours = int(np.floor(hours))+1
+        if not threshold+1:
+            hours = 0 if hours <= 0 else self.numHours+1
+        return self._fractionOfPoints(hours,threshold+1)
+
+    def _pooled(self):
+        if self._pooledValues is None:
+            self._pooledValues = np.sort(self.sortedValues,axis=None)
+        return self._pooledValues
+
+    def UDI(self,low=100,high=2000):
+        """
+        :return: The fractions of all the point-hours in the low (below low), mid (low to high) and high (above high)
+            bands of metricUDIdetailed, ie the average over the points of the fractions of hours in each band.
+        """
+        pooled = self._pooled()
+        total = pooled.size
+        lowCount = np.searchsorted(pooled,self._threshold(low-1),side='right') if low-1 else 0
+        midCount = np.searchsorted(pooled,self._threshold(high),side='right')-\
+                   np.searchsorted(pooled,self._threshold(low),side='left')
+        highCount = total-np.searchsorted(pooled,self._threshold(high+1),side='left') if high+1 else 0
+        return float(lowCount)/total,float(max(midCount,0))/total,float(highCount)/total
+
+    def sDATable(self,thresholds,fractions=(0.5,)):
+        """
+        :return: An array of fractions x thresholds containing sDA for every combination.
+        """
+        return np.array([[self.sDA(threshold,fraction) for threshold in thresholds] for fraction in fractions])
+
+    def ASETable(self,thresholds,hours=(250,)):
+        """
+        :return: An array of hours x thresholds containing ASE for every combination.
+        """
+        return np.array([[self.ASE(threshold,hourLimit) for threshold in thresholds] for hourLimit in hours])
+
+    def UDITable(self,bands):
+        """
+        :param bands: A list of (low,high) thresholds.
+        :return: An array of bands x 3 containing the low, mid and high UDI fractions of every band.
+        """
+        return np.array([self.UDI(low,high) for low,high in bands])
+
+
+def benchmark(dayill,repeat=3,**metricArgs):
+    """
+    Time the separate metric methods of a Dayill against Dayill.metricsSummary, and check that they give the same
+    numbers.
+
+    :param dayill: A Dayill.
+    :param repeat: Number of times that each is run. The fastest time is reported.
+    :param metricArgs: Arguments for Dayill.metricsSummary.
+    :return: A dictionary containing the time taken by the separate methods and by metricsSummary, in seconds, and
+        whether their results match.
+    """
+    startTime,endTime = metricArgs.get('startTime',8),metricArgs.get('endTime',18)
+    pointMask = metricArgs.get('pointMask')
+    sdaThreshold,DA = metricArgs.get('sdaThreshold',300),metricArgs.get('DA',0.5)
+    aseThreshold,aseHours = metricArgs.get('aseThreshold',1000),metricArgs.get('aseHours',250)
+    udiLow,udiHigh = metricArgs.get('udiLow',100),metricArgs.get('udiHigh',2000)
+
+    def separate():
+        return {'sDA':dayill.metricSDA(sdaThreshold,startTime,endTime,DA,pointMask=pointMask),
+                'sDAdetailed':dayill.metricSDAdetailed(sdaThreshold,startTime,endTime,pointMask=pointMask),
+                'ASE':dayill.metricASE(aseThreshold,startTime,endTime,aseHours,pointMask=pointMask),
+                'ASEdetailed':dayill.metricASEdetailed(aseThreshold,startTime,endTime,pointMask=pointMask),
+                'UDIdetailed':dayill.metricUDIdetailed(udiLow,udiHigh,startTime,endTime,pointMask=pointMask)}
+
+    def fused():
+        return dayill.metricsSummary(**metricArgs)
+
+    timings = {}
+    results = {}
+    for name,function in (('separate',separate),('fused',fused)):
+        times = []
+        for _ in range(repeat):
+            start = time.time()
+            results[name] = function()
+            times.append(time.time()-start)
+        timings[name] = min(times)
+
+    timings['match'] = all(results['separate'][key] == results['fused'][key] for key in results['separate'])
+    return timings
+
+
+if __name__ == '__main__':
+    # Usage: python metrics.py illFile ptsFile
+    from dayIll import Dayill
+    timings = benchmark(Dayill(sys.argv[1],sys.argv[2]))
+    print("Separate metric methods: %.3fs, metricsSummary: %.3fs, results match: %s"%(timings['separate'],
+                                                                                       timings['fused'],
+                                                                                       timings['match']))
@@ -0,0 +1,213 @@
+"""
+    Counting illuminance bands and parsing ill files with a pool of processes.
+
+    The hours x points data is shared with the worker processes through a memory-mapped .npy file instead of being
+    pickled: every worker maps the file and counts the hours of a partition of the points. The partitions are
+    contiguous ranges of points, so each worker only reads its own part of every row, and the counts of the
+    partitions are joined in the order of the points.
+
+    Text files are parsed in parallel by dividing their rows into byte ranges that begin and end at rows. Every worker
+    parses a range and writes its rows straight into a shared memory-mapped array, at the positions of the rows.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import atexit
+import weakref
+import tempfile
+import multiprocessing as mp
+
+import numpy as np
+import metrics
+import timeSeries
+
+# Weak references to the arrays whose files are removed when the arrays are garbage collected.
+_ownedFiles = {}
+
+
+def _isSharedFile(array):
+    """Return True if array is a whole .npy file mapped into memory, which the worker processes can map as well."""
+    if not isinstance(array,np.memmap) or not array.filename or not array.filename.endswith('.npy'):
+        return False
+    if not array.flags.c_contiguous or array.mode == 'c':
+        # The changes to a copy-on-write array are not seen by the other processes.
+        return False
+    try:
+        mapped = np.load(array.filename,mmap_mode='r')
+    except (IOError,ValueError):
+        return False
+    return mapped.shape == array.shape and mapped.dtype == array.dtype and mapped.offset == array.offset
+
+
+def sharedArray(array,directory=None):
+    """
+    Return array as a memory-mapped .npy file that other processes can map. Arrays that are already mapped from a
+    .npy file are returned as they are. Other arrays are copied to a temporary file, which is deleted when the
+    returned array (and every view of it) is garbage collected.
+
+    :param array: A numpy array.
+    :param directory: Directory for the temporary file. Defaults to the temporary directory of the system. This
+        should be on a local disk (or a ram disk such as /dev/shm) with room for the array.
+    """
+    if _isSharedFile(array):
+        return array
+
+    shared = _sharedFile(array.shape,array.dtype,directory)
+    shared[:] = array
+    shared.flush()
+    return _ownFile(shared)
+
+
+def _sharedFile(shape,dtype,directory=None):
+    """Create a memory-mapped .npy file in directory, or in the temporary directory of the system."""
+    handle,filePath = tempfile.mkstemp(prefix='sharedIll',suffix='.npy',dir=directory)
+    os.close(handle)
+    return np.lib.format.open_memmap(filePath,mode='w+',dtype=dtype,shape=shape)
+
+
+def _removeFile(filePath):
+    try:
+        os.remove(filePath)
+    except OSError:
+        pass
+
+
+def _ownFile(array):
+    """
+    Remove the file of a memory-mapped array when the array is garbage collected. Views of the array keep it alive.
+    Windows does not remove files that are still mapped, so if the file cannot be removed then, it is removed when
+    python exits.
+    """
+    filePath = array.filename
+
+    def release(reference):
+        _ownedFiles.pop(id(reference),None)
+        try:
+            os.remove(filePath)
+        except OSError:
+            atexit.register(_removeFile,filePath)
+
+    reference = weakref.ref(array,release)
+    _ownedFiles[id(reference)] = reference
+    return array
+
+
+def mapInPool(func,args,processes=None):
+    """
+    Return map(func,args), computed by a pool of processes if there is more than one process and more than one
+    argument. On Windows, a script that uses more than one process needs an if __name__ == '__main__': guard.
+
+    :param func: A module level function of one argument, so that the processes can run it.
+    :param args: A list of the arguments.
+    :param processes: Number of processes. Defaults to the number of cpus. No more processes are started than there
+        are arguments.
+    """
+    processes = processes or mp.cpu_count()
+    if processes<2 or len(args)<2:
+        return map(func,args)
+
+    pool = mp.Pool(min(processes,len(args)))
+    try:
+        return pool.map(func,args)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _countPartition(args):
+    """Count the bands of a partition of the points."""
+    dataPath,bands,hourIndices,pointIndices = args
+    data = np.load(dataPath,mmap_mode='r')
+    return metrics.countBands(data,bands,hourIndices,pointIndices)
+
+
+def countBands(data,bands,hourIndices=None,pointIndices=None,processes=None,partitions=None,directory=None):
+    """
+    Count the hours for which the illuminance at each point lies within a set of bands, with a pool of processes.
+    The result is the same as that of metrics.countBands.
+
+    :param data: An array of hours x points. Unless it is already mapped from a .npy file, it is copied to a temporary
+        file first, which is removed when the count is done. Pass the result of sharedArray to count several times
+        without copying the data each time.
+    :param bands: A list of (lower,upper) limits, see metrics.BandCounter.
+    :param hourIndices: The hours to be counted. Defaults to all the hours.
+    :param pointIndices: The points to be counted. Defaults to all the points.
+    :param processes: Number of processes. Defaults to the number of cpus.
+    :param partitions: Number of partitions of the points. Defaults to 4 for every process, so that the work stays
+        balanced when some processes are slower.
+    :param directory: Directory for the temporary file. See sharedArray.
+    :return: A metrics.BandCounter.
+    """
+    processes = processes or mp.cpu_count()
+    data = sharedArray(data,directory)
+
+    if hourIndices is None:
+        hourIndices = np.arange(len(data))
+    if pointIndices is None:
+        pointIndices = np.arange(data.shape[1])
+    pointIndices = np.asarray(pointIndices,dtype=np.intp)
+
+    partitions = max(1,min(partitions or 4*processes,len(pointIndices)))
+    args = [(data.filename,bands,hourIndices,partition) for partition in np.array_split(pointIndices,partitions)]
+
+    return metrics.BandCounter.concatenate(mapInPool(_countPartition,args,processes))
+
+
+def _parseRange(args):
+    """Parse the rows in a byte range of a text file into the shared output array."""
+    filePath,outputPath,firstRow,starts,ends,numValues,timeColumns,points = args
+    output = np.load(outputPath,mmap_mode='r+')
+
+    base = starts[0]
+    with open(filePath,'rb') as textFile:
+        textFile.seek(base)
+        text = textFile.read(ends[-1]-base)
+
+    for row,(start,end) in enumerate(zip(starts.tolist(),ends.tolist()),firstRow):
+        lineSplit = text[start-base:end-base].decode('ascii').split(None,timeColumns)
+        valueText = lineSplit[timeColumns] if len(lineSplit)>timeColumns else ''
+        values = np.fromstring(valueText,dtype=np.float64,sep=' ')
+        if len(values) != numValues:
+            raise ValueError('The row %s of %s has %s values instead of %s. It might contain text.'%(
+                row,filePath,len(values),numValues))
+        output[row] = values if points is None else values[points]
+
+    output.flush()
+    return firstRow
+
+
+def parseRows(filePath,starts,ends,numValues,timeColumns=3,points=None,dtype=np.float64,processes=None,parts=None,
+              directory=None):
+    """
+    Parse the rows of a text file with a pool of processes, into an array of rows x values.
+
+    :param filePath: Path of the file, for example a Daysim ill file or a Radiance ascii matrix.
+    :param starts: The byte offsets at which the rows begin, as returned by timeSeries.lineOffsets or IllRowIndex.
+        Lines that are not in starts, such as headers, are skipped.
+    :param ends: The byte offsets at which the rows end.
+    :param numValues: The number of values in every row, not counting the timestamp columns.
+    :param timeColumns: The number of columns before the values, which are skipped. 3 (month, date and hour) for
+        Daysim files and 0 for Radiance files.
+    :param points: The indices of the values to be kept, starting from 0. Defaults to all the values.
+    :param dtype: Data type of the result. Defaults to float64.
+    :param processes: Number of processes. Defaults to the number of cpus.
+    :param parts: Number of byte ranges that the rows are divided into. Defaults to 4 for every process.
+    :param directory: Directory for the shared array. See sharedArray.
+    :return: A memory-mapped array of rows x values (or rows x points), with the rows in the order of starts. It can
+        be passed to countBands without being copied. Its temporary file is removed when the array (and every view
+        of it) is garbage collected.
+    :raises ValueError: If a row does not have numValues values.
+    """
+    processes = processes or mp.cpu_count()
+    numColumns = numValues if points is None else len(points)
+    output = _ownFile(_sharedFile((len(starts),numColumns),dtype,directory))
+    if points is not None:
+        points = np.asarray(points,dtype=np.intp)
+
+    args = [(filePath,output.filename,firstRow,starts[firstRow:stopRow],ends[firstRow:stopRow],numValues,timeColumns,
+             points) for firstRow,stopRow,_,_ in timeSeries.byteRanges(starts,ends,parts or 4*processes)]
+
+    mapInPool(_parseRange,args,processes)
+    return output
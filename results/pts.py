@@ -1,19 +1,29 @@
 """
-    This module defines two classes:
+    This module defines three classes:
         1. Point is a simple 3d Point
         2. roomgrid is a collection of points in a room. that can be read off of a pts file or a zone file.
+        3. roomgridset is a collection of roomgrids, for example all the points files of a building.
+
+    The points of a roomgrid are stored in a numpy array. Point objects are only created when they are asked for.
 """
 
 from __future__ import print_function
 from __future__ import division
 
 import os
+import glob
 import logging
 logger = logging.getLogger("__main__")
 logging.basicConfig(format='%(asctime)s -%(levelname)s module:%(module)s function:%(funcName)s message--%(message)s')
 
 
 import logging
+from collections import Mapping
+import numpy as np
+import filecache
+import parallel
+from spatial import SpatialIndex,pointsInPolygon
+import regions
 
 class Point(object):
     def __init__(self,x,y,z,vector,idx=None):
@@ -28,14 +38,89 @@ class Point(object):
         """retrun a string representation of the point"""
         return "3D Point at x:{}, y:{}, z:{}. The vector is {}".format(self.x,self.y,self.z,self.vector)
 
+class _PointsView(Mapping):
+    """
+    A read-only dictionary-like view of a points array. The keys are the indices of the points and the values are
+    Point objects, which are created only when a key is accessed.
+    """
+    def __init__(self,ptsarr):
+        self._ptsarr = ptsarr
+
+    def __getitem__(self,idx):
+        if not isinstance(idx,(int,long,np.integer)) or not 0<=idx<len(self._ptsarr):
+            raise KeyError(idx)
+        x,y,z,vx,vy,vz = self._ptsarr[idx].tolist()
+        return Point(x,y,z,[vx,vy,vz],int(idx))
+
+    def __iter__(self):
+        return iter(xrange(len(self._ptsarr)))
+
+    def __len__(self):
+        return len(self._ptsarr)
+
+def _spacings(coord):
+    """Return the sorted unique spacings, rounded to 4 decimal digits, between the values in coord."""
+    unique = np.round(np.sort(coord),4)
+    if len(unique)-1:
+        return np.unique(np.round(np.diff(unique),4)).tolist()
+    return ()
+
+class GridGeometry(object):
+    """
+    The derived geometry of a points array: extents, unique coordinates, spacings, grid shape and the position of
+    every point in the grid. It is computed once from the points array and only holds numpy arrays and tuples, so it
+    is cheap to pickle and send to worker processes.
+    """
+    def __init__(self,ptsarr):
+        coords = ptsarr[:,:3]
+        uniqueAndIndices = [np.unique(coords[:,dim],return_inverse=True) for dim in range(3)]
+
+        self.numPoints = len(ptsarr)
+        self.uniqueCoords = tuple(unique for unique,_ in uniqueAndIndices)
+        self.gridIndices = np.column_stack([indices for _,indices in uniqueAndIndices]).reshape(-1,3)
+        self.shape = tuple(len(unique) for unique in self.uniqueCoords)
+        self.cellIndex = np.ravel_multi_index(self.gridIndices.T,self.shape) if self.numPoints else \
+            np.zeros(0,dtype=np.intp)
+        self.spacings = tuple(_spacings(unique) for unique in self.uniqueCoords)
+
+        # The unique coordinates are sorted, so the extents are their first and last values.
+        self.extents = tuple((float(unique[0]),float(unique[-1])) if len(unique) else (None,None)
+                             for unique in self.uniqueCoords)
+
+    @property
+    def gridSize(self):
+        """The maximum possible number of points in the grid."""
+        return int(np.prod(self.shape))
+
 class RoomGrid(object):
     """
     Analyze a daysim format points file.
+
+    The points are stored in ptsarr, which is a N x 6 array of x,y,z,vx,vy,vz values in the order that the points
+    were found in the points file. The extents, unique coordinates, spacings etc. are calculated once and stored in
+    geometry. Assigning a new ptsarr resets geometry. If ptsarr is modified in place, call invalidateGeometry.
+
+    Nearest-point, radius and box queries (nearestPoints, pointsWithinRadius, pointsInBox) use a spatial index that
+    is created the first time that it is needed.
     """
-    def __init__(self,ptsfile):
+    def __init__(self,ptsfile,useCache=False,cacheDir=None):
+        """
+        :param ptsfile: A Daysim format points file, or a zone file.
+        :param useCache: If set to True, the parsed points are stored in a binary cache next to the points file (or
+            in cacheDir) and read back from there, memory-mapped, as long as the size and modification time of the
+            points file do not change. Defaults to False.
+        :param cacheDir: Directory in which the cache should be stored. Defaults to the directory of the points file.
+        """
 
         assert os.path.exists(ptsfile),'The points file %s was not found'%ptsfile
 
+        if useCache:
+            cacheDirPath = filecache.cachePath(ptsfile,'.ptscache',cacheDir)
+            cachedArrays = filecache.readCache(cacheDirPath,[ptsfile])
+            if cachedArrays is not None:
+                self.ptsarr = cachedArrays['ptsarr']
+                return
+        ptsfilePath = ptsfile
 
         try:
             with open(ptsfile) as ptsstring:
@@ -43,37 +128,175 @@ class RoomGrid(object):
         except:
             pass
 
-        self.ptsdict = self.procPtsFile(ptsfile)
+        self.ptsarr = self.procPtsFile(ptsfile)
 
+        if useCache:
+            filecache.writeCache(cacheDirPath,[ptsfilePath],{'ptsarr':self.ptsarr})
 
-    def procPtsFile(self,ptsfile,vector=[0,0,1]):
-        """Return a dictionary containing points """
-        ptsdict = {}
+    @classmethod
+    def fromArray(cls,ptsarr):
+        """
+        Create a roomgrid from an existing N x 6 array of x,y,z,vx,vy,vz values. The array is not copied.
+        """
+        ptsarr = np.asarray(ptsarr,dtype=np.float64)
+        assert ptsarr.ndim == 2 and ptsarr.shape[1] == 6, 'The points array should be N x 6, not %s'%(ptsarr.shape,)
+        roomgrid = cls.__new__(cls)
+        roomgrid.ptsarr = ptsarr
+        return roomgrid
+
+    def procPtsFile(self,ptsfile,vector=(0,0,1)):
+        """Return a N x 6 array containing the coordinates and vectors of the points """
+        ptsrows = []
+        # Formatting a message for every point is expensive, so only do it if it is going to be logged.
+        logPoints = logger.isEnabledFor(logging.DEBUG)
 
         for idx,lines in enumerate(ptsfile):
 
-            try:
-                linesnum = map(float,lines.split())
-                x,y,z=linesnum[:3]
+            linesnum = map(float,lines.split())
+            x,y,z=linesnum[:3]
 
-                # This assertion is meant for checking if there are 6 values in line,
-                #  ie its a pts file. If yes get vector from the pts file. Else use
-                #  default or user defined vector
-                assert len(linesnum)==6
-                vector = linesnum[3:]
-                temppt = Point(x,y,z,vector,idx)
-                ptsdict[temppt.idx]=temppt
+            # If there are 6 values in line, ie its a pts file, get vector from the pts file. Else use
+            # default or user defined vector
+            if len(linesnum)==6:
+                ptsrows.append(linesnum)
+            else:
+                ptsrows.append([x,y,z]+list(vector))
 
-            # If the assertion fails use the vector value which is defined default or specified.
-            except AssertionError:
-                linesnum = map(float,lines.split())
-                x,y,z=linesnum[:3]
-                temppt = Point(x,y,z,vector,idx)
-                ptsdict[temppt.idx]=temppt
+            if logPoints:
+                logger.debug("x: {}y: {}z: {}v: {}".format(x,y,z,ptsrows[-1][3:]))
 
-            logging.info("x: {}y: {}z: {}v: {}".format(x,y,z,vector))
+        return np.array(ptsrows,dtype=np.float64).reshape(-1,6)
 
-        return ptsdict
+    @property
+    def ptsarr(self):
+        """
+        :return: A N x 6 array containing x,y,z,vx,vy,vz values of the points.
+        """
+        return self._ptsarr
+
+    @ptsarr.setter
+    def ptsarr(self,ptsarr):
+        self._ptsarr = ptsarr
+        self.invalidateGeometry()
+
+    @property
+    def geometry(self):
+        """
+        :return: A GridGeometry containing the extents, unique coordinates, spacings and shape of the grid. This is
+        calculated once and reused until the points change.
+        """
+        if self._geometry is None:
+            self._geometry = GridGeometry(self.ptsarr)
+        return self._geometry
+
+    def invalidateGeometry(self):
+        """Discard the stored geometry. This needs to be called if ptsarr has been modified in place."""
+        self._geometry = None
+        self._spatialIndexes = {}
+        self._adjacency = {}
+
+    def spatialIndex(self,dimensions=3):
+        """
+        :param dimensions: 3 (default) for an index of x,y,z coordinates, or 2 for an index of x,y coordinates only.
+        :return: A SpatialIndex of the points. The bucket size is the grid spacing if the points are uniformly
+            spaced in x and y. The index is created once and reused until the points change.
+        """
+        if dimensions not in self._spatialIndexes:
+            xSpacings,ySpacings = self.geometry.spacings[:2]
+            cellSize = None
+            if len(xSpacings)==1 and len(ySpacings)==1:
+                cellSize = max(xSpacings[0],ySpacings[0])
+            self._spatialIndexes[dimensions] = SpatialIndex(self.ptsarr[:,:dimensions],cellSize)
+        return self._spatialIndexes[dimensions]
+
+    def nearestPoints(self,probes,returnDistance=False):
+        """
+        Find the grid point nearest to each probe location, for example the location of a sensor.
+
+        :param probes: A M x 3 array of x,y,z coordinates, or a M x 2 array of x,y coordinates to ignore z.
+        :param returnDistance: If True, also return the distances to the nearest points.
+        :return: An array containing the index of the nearest point for each probe.
+        """
+        probes = np.asarray(probes,dtype=np.float64).reshape(-1,np.shape(probes)[-1])
+        return self.spatialIndex(probes.shape[1]).nearest(probes,returnDistance)
+
+    def pointsWithinRadius(self,probes,radius):
+        """
+        Find the grid points within a distance of each probe location.
+
+        :param probes: A M x 3 array of x,y,z coordinates, or a M x 2 array of x,y coordinates to ignore z.
+        :param radius: Search radius.
+        :return: A list containing an array of point indices for each probe.
+        """
+        probes = np.asarray(probes,dtype=np.float64).reshape(-1,np.shape(probes)[-1])
+        return self.spatialIndex(probes.shape[1]).withinRadius(probes,radius)
+
+    def pointsInBox(self,minCorners,maxCorners):
+        """
+        Find the grid points inside one or more axis-aligned boxes, for example furniture footprints.
+
+        :param minCorners: A M x 3 (or M x 2 to ignore z) array containing the lower corner of each box.
+        :param maxCorners: A M x 3 (or M x 2 to ignore z) array containing the upper corner of each box.
+        :return: A list containing an array of point indices for each box.
+        """
+        minCorners = np.asarray(minCorners,dtype=np.float64).reshape(-1,np.shape(minCorners)[-1])
+        return self.spatialIndex(minCorners.shape[1]).inBox(minCorners,maxCorners)
+
+    def polygonMask(self,polygon):
+        """
+        Find the points that lie inside a polygon in plan, for example a perimeter zone or a regularly occupied area.
+
+        :param polygon: A sequence of (x,y) or (x,y,z) vertices.
+        :return: A boolean array that is True for the points inside the polygon. This can be passed as pointMask to
+            the metric methods of Dayill.
+        """
+        return pointsInPolygon(self.ptsarr,polygon)
+
+    def polygonMasks(self,polygons):
+        """
+        :param polygons: A sequence of polygons, each a sequence of (x,y) or (x,y,z) vertices.
+        :return: A boolean array with a row for every polygon, and a column for every point.
+        """
+        return np.array([self.polygonMask(polygon) for polygon in polygons],dtype=bool).reshape(-1,len(self.ptsarr))
+
+    @property
+    def ptsdict(self):
+        """
+        :return: A dictionary-like view of the points, keyed by their index. The Point objects are created only when
+        they are accessed.
+        """
+        return _PointsView(self.ptsarr)
+
+    @property
+    def coordinates(self):
+        """
+        :return: A N x 3 array view of the x,y,z coordinates of the points.
+        """
+        return self.ptsarr[:,:3]
+
+    @property
+    def vectors(self):
+        """
+        :return: A N x 3 array view of the vectors of the points.
+        """
+        return self.ptsarr[:,3:]
+
+    def __len__(self):
+        return len(self.ptsarr)
+
+    def subset(self,points):
+        """
+        Return a new roomgrid containing some of the points, for example the points inside a polygon.
+
+        :param points: A boolean mask with a value for every point (as returned by polygonMask), or the indices of
+            the points starting from 0. The points are in the order of the indices.
+        """
+        points = np.asarray(points)
+        if points.dtype == bool:
+            assert len(points) == len(self), \
+                'The length of the mask(%s) should be equal to the number of points(%s).'%(len(points),len(self))
+            points = np.flatnonzero(points)
+        return RoomGrid.fromArray(self.ptsarr[points.astype(np.intp)])
 
     @property
     def minMax(self):
@@ -82,89 +305,83 @@ class RoomGrid(object):
         will be something like {'x':(minX,maxX),'y':(minY,maxY),'z':(minZ,maxZ)}
 
         """
-        return {'x':(self.minX,self.maxX),'y':(self.minY,self.maxY),'z':(self.minZ,self.maxZ)}
+        extents = self.geometry.extents
+        return {'x':extents[0],'y':extents[1],'z':extents[2]}
 
     @property
     def minX(self):
         """
         :return: Return the min X coordinate for the entire grid.
         """
-        return min([pt.x for pt in self.ptsdict.values()])
+        return self.geometry.extents[0][0]
 
     @property
     def maxX(self):
         """
         :return: Return the max X coordinate for the entire grid.
         """
-        return max([pt.x for pt in self.ptsdict.values()])
+        return self.geometry.extents[0][1]
 
     @property
     def minY(self):
         """
         :return: Return the min Y coordinate for the entire grid.
         """
-        return min([pt.y for pt in self.ptsdict.values()])
+        return self.geometry.extents[1][0]
 
     @property
     def maxY(self):
         """
         :return: Return the max Y coordinate for the entire grid.
         """
-        return max([pt.y for pt in self.ptsdict.values()])
+        return self.geometry.extents[1][1]
 
     @property
     def minZ(self):
         """
         :return: Return the min Z coordinate for the entire grid.
         """
-        return min([pt.z for pt in self.ptsdict.values()])
+        return self.geometry.extents[2][0]
 
     @property
     def maxZ(self):
         """
         :return: Return the max Z coordinate for the entire grid.
         """
-        return max([pt.z for pt in self.ptsdict.values()])
+        return self.geometry.extents[2][1]
 
     @property
     def ptArray(self):
-        """return an array of points sorted according to their index value"""
-
-        # sort the points according to their index values.
-        ptslist = sorted(self.ptsdict.values(),key=lambda pt:pt.idx)
-        ptslist = [(pt.x,pt.y,pt.z,pt.vector)for pt in ptslist]
-
-        return ptslist
+        """return a list of points in the order that they were found in the points file"""
+        return [(x,y,z,[vx,vy,vz]) for x,y,z,vx,vy,vz in self.ptsarr.tolist()]
 
     @property
     def ptArrayXYZ(self):
         """Return list of points in the order that they were found in the points file."""
-        return [(x,y,z)for x,y,z,vector in self.ptArray]
+        return [tuple(pt) for pt in self.coordinates.tolist()]
 
     @property
     def ptArrayX(self):
-        """Return list of X dimensions alone in the order that they were found in the points file."""
-        return [x for x,y,z,vector in self.ptArray]
+        """Return an array view of X dimensions alone in the order that they were found in the points file."""
+        return self.ptsarr[:,0]
 
     @property
     def ptArrayY(self):
-        """Return list of Y dimensions alone in the order that they were found in the points file."""
-        return [y for x,y,z,vector in self.ptArray]
+        """Return an array view of Y dimensions alone in the order that they were found in the points file."""
+        return self.ptsarr[:,1]
 
     @property
     def ptArrayZ(self):
-        """Return list of Z dimensions alone in the order that they were found in the points file."""
-        return [z for x,y,z,vector in self.ptArray]
+        """Return an array view of Z dimensions alone in the order that they were found in the points file."""
+        return self.ptsarr[:,2]
 
     @property
     def uniCor(self):
         """return a dictionary containing of tuples of unique coordinates in x,y,z direction"""
-        ptslist = self.ptsdict.values() #sort the points according to their index values.
-        ptsx = sorted(set([pt.x for pt in ptslist]))
-        ptsy = sorted(set([pt.y for pt in ptslist]))
-        ptsz = sorted(set([pt.z for pt in ptslist]))
-        maxgridsize = len(ptsx)*len(ptsy)*len(ptsz)
-        actgridsize = len(self.ptsdict)
+        geometry = self.geometry
+        ptsx,ptsy,ptsz = [unique.tolist() for unique in geometry.uniqueCoords]
+        maxgridsize = geometry.gridSize
+        actgridsize = geometry.numPoints
         return {'x':ptsx,'y':ptsy,'z':ptsz,'maxgridsize':maxgridsize,'actgridsize':actgridsize}
 
     @property
@@ -172,27 +389,27 @@ class RoomGrid(object):
         """
         :return: List of unique x coordinates
         """
-        return self.uniCor['x']
+        return self.geometry.uniqueCoords[0].tolist()
 
     @property
     def uniCorY(self):
         """
         :return: List of unique y coordinates
         """
-        return self.uniCor['y']
+        return self.geometry.uniqueCoords[1].tolist()
 
     @property
     def uniCorZ(self):
         """
         :return: List of unique z coordinates
         """
-        return self.uniCor['z']
+        return self.geometry.uniqueCoords[2].tolist()
 
     @property
     def gridSizeMax(self):
         """Maximum possible gridsize. If the pts file is a square grid with 10x 10y pts
         then this value will be 100"""
-        return self.uniCor['maxgridsize']
+        return self.geometry.gridSize
 
     @property
     def gridSizeActual(self):
@@ -211,19 +428,7 @@ class RoomGrid(object):
         """
 
         spcdict = dict.fromkeys(('x_spacings','y_spacings','z_spacings'),())
-        coord = self.uniCor
-        rounder = lambda lst:[round(val,4)for val in lst] #lambda for rounding to 4 dec digits.
-        x,y,z = rounder(sorted(coord['x'])),rounder(sorted(coord['y'])),rounder(sorted(coord['z'])) #Sort and round values for unique x,y,z coord
-
-        if len(x)-1: #If there are more than 1 unique points in x..then check for spacing..same applies to other coords
-             xspc= set(rounder([x[idx]-x[idx-1]for idx in range(1,len(x))]))
-             spcdict['x_spacings']=sorted(xspc)
-        if len(y)-1: #If there are more than 1 unique points in x..then check for spacing..same applies to other coords
-             yspc= set(rounder([y[idx]-y[idx-1]for idx in range(1,len(y))]))
-             spcdict['y_spacings']=sorted(yspc)
-        if len(z)-1: #If there are more than 1 unique points in x..then check for spacing..same applies to other coords
-             zspc= set(rounder([z[idx]-z[idx-1]for idx in range(1,len(z))]))
-             spcdict['z_spacings']=sorted(zspc)
+        spcdict['x_spacings'],spcdict['y_spacings'],spcdict['z_spacings'] = self.geometry.spacings
         return spcdict
 
     @property
@@ -236,39 +441,50 @@ class RoomGrid(object):
         scaledGrid refers to the spatial scaling, while grid refers to index-based scaling,
         both in x,y,z dimensions.
         """
-        unicor = self.uniCor
-        ptarray = self.ptArray
-
-
-        x,y,z,maxgrid,act = unicor['x'],unicor['y'],unicor['z'],unicor['maxgridsize'],unicor['actgridsize']
-        xlen,ylen,zlen = map(len,(x,y,z))
-        xmin,ymin,zmin = map(min,(x,y,z))
-        xmax,ymax,zmax = map(max,(x,y,z))
+        grids = (self.gridIndices+1).tolist()
 
-        #This lambda is for calculating on basis of grid pont
-        grid = lambda point:(x.index(point[0])+1,y.index(point[1])+1,z.index(point[2])+1)
+        coords = self.coordinates
+        mins,maxs = coords.min(axis=0),coords.max(axis=0)
+        ranges = maxs-mins
+        # Dimensions with a single unique coordinate are scaled to 0.
+        scaled = np.zeros(coords.shape)
+        scaled[:,ranges>0] = np.round((coords[:,ranges>0]-mins[ranges>0])/ranges[ranges>0],3)
+        scaledgrids = scaled.tolist()
 
-        gridscale = lambda point:(round(point[0]/xmin,3),round(point[1]/ymin,3),round(point[2]/zmin,3))
+        return [{'grid':tuple(gridlist),'scaledGrid':tuple(scaledgrids[idx])}for idx,gridlist in enumerate(grids)]
 
-        if  (xmin-xmax):
-            gridscalex = lambda point:round((point[0]-xmin)/(xmax-xmin),3)
-        else:
-            gridscalex = lambda point:0
-
-        if  (ymin-ymax):
-            gridscaley = lambda point:round((point[1]-ymin)/(ymax-ymin),3)
-        else:
-            gridscaley = lambda point:0
+    @property
+    def gridIndices(self):
+        """
+        :return: A N x 3 integer array containing the position of each point in the unique coordinates (uniCorX,
+        uniCorY, uniCorZ) in x,y and z.
+        """
+        return self.geometry.gridIndices
 
-        if  (zmin-zmax):
-            gridscalez = lambda point:round((point[1]-zmin)/(zmax-zmin),3)
-        else:
-            gridscalez = lambda point:0
+    @property
+    def gridShape(self):
+        """
+        :return: The number of unique coordinates in x,y,z. For a square grid containing 100 points this will be
+        something like (10,10,1).
+        """
+        return self.geometry.shape
 
-        grids = [grid(point)for point in ptarray]
-        scaledgrids = [(gridscalex(point),gridscaley(point),gridscalez(point)) for point in ptarray]
+    @property
+    def gridCellIndex(self):
+        """
+        :return: An integer array containing the index of each point in gridMatrixFull. This is the inverse of
+        gridCellPoints.
+        """
+        return self.geometry.cellIndex
 
-        return [{'grid':gridtuple,'scaledGrid':scaledgrids[idx]}for idx,gridtuple in enumerate(grids)]
+    @property
+    def gridCellPoints(self):
+        """
+        :return: An integer array, as long as gridMatrixFull, containing the index of the point at each location
+        of gridMatrixFull. Locations without a point are set to -1. If a coordinate is repeated in the points file,
+        the first point at that location is kept, as in adjacency.
+        """
+        return regions.gridCellPoints(self.gridCellIndex,self.geometry.gridSize)
 
     @property
     def gridMatrixFull(self):
@@ -305,57 +521,95 @@ class RoomGrid(object):
         This property is useful in creating a rectangular grid of points from a non rectangular shaped pts file.
         :return:
         """
-        fullGridMatrix = self.gridMatrixFull
-        ptArray = self.ptArrayXYZ
-        locations = []
-        for pointTuples in fullGridMatrix:
-            if pointTuples in ptArray:
-                locations.append(ptArray.index(pointTuples))
-            else:
-                locations.append(None)
+        locations = [None if idx<0 else idx for idx in self.gridCellPoints.tolist()]
 
         return locations
 
+    def adjacency(self,diagonal=False):
+        """
+        :param diagonal: If True, points that touch diagonally in gridMatrixFull are neighbours as well.
+        :return: The neighbours of the points as two arrays, indptr and indices. The neighbours of point i are
+            indices[indptr[i]:indptr[i+1]]. This is calculated once and reused until the points change.
+        """
+        if diagonal not in self._adjacency:
+            self._adjacency[diagonal] = regions.gridAdjacency(self.gridIndices,self.gridShape,diagonal)
+        return self._adjacency[diagonal]
+
+    @property
+    def pointAreas(self):
+        """
+        :return: An array containing the floor area represented by every point, ie the product of the widths of
+        its grid cell in x and y. For a uniformly spaced grid this is spacingX*spacingY for every point.
+        """
+        geometry = self.geometry
+        widthX = regions.cellWidths(geometry.uniqueCoords[0])
+        widthY = regions.cellWidths(geometry.uniqueCoords[1])
+        return widthX[geometry.gridIndices[:,0]]*widthY[geometry.gridIndices[:,1]]
+
+    def labelRegions(self,mask,diagonal=False):
+        """
+        Find the clusters of neighbouring points in a mask, for example the points whose metricASEdetailed is above
+        250 hours.
+
+        :param mask: A boolean array with a value for every point.
+        :param diagonal: If True, points that touch diagonally are counted as connected. Defaults to False.
+        :return: A dictionary containing:
+            labels: The cluster of every point, numbered from 0 in order of decreasing size, or -1 for the points
+                that are not in the mask.
+            sizes: The number of points in every cluster.
+            areas: The floor area of every cluster (see pointAreas).
+        """
+        mask = np.asarray(mask,dtype=bool)
+        assert mask.shape == (len(self.ptsarr),), \
+            'The mask should have a value for every point(%s), not %s.'%(len(self.ptsarr),mask.shape)
+
+        labels,sizes = regions.labelRegions(mask,*self.adjacency(diagonal))
+        areas = np.bincount(labels[mask],weights=self.pointAreas[mask],minlength=len(sizes))
+        return {'labels':labels,'sizes':sizes,'areas':areas}
+
+    def rasterize(self,values,fillValue=np.nan):
+        """
+        Scatter values for the points into a rectangular grid, for plotting heatmaps of irregularly shaped rooms.
+
+        :param values: An array with a value for every point, for example a metric, or an array whose last
+            dimension is the points, for example hours x points.
+        :param fillValue: Value for the locations of gridMatrixFull that do not have a point. Defaults to NaN.
+        :return: An array of shape (..., X, Y) where X and Y are the number of unique x and y coordinates, or
+            (..., X, Y, Z) if the points have more than one z coordinate. The leading dimensions are those of values.
+        """
+        values = np.asarray(values)
+        assert values.shape[-1:] == (len(self.ptsarr),), \
+            'The last dimension of values(%s) should be the number of points(%s).'%(values.shape,len(self.ptsarr))
+
+        geometry = self.geometry
+        leadShape = values.shape[:-1]
+        raster = np.full(leadShape+(geometry.gridSize,),fillValue,dtype=np.result_type(values.dtype,np.float32))
+        raster[...,geometry.cellIndex] = values
+
+        raster = raster.reshape(leadShape+geometry.shape)
+        if geometry.shape[2] == 1:
+            raster = raster[...,0]
+        return raster
+
     @property
     def spacingX(self):
         """
         :return: X spacing between grid points
         """
-        coord = self.uniCorX
-        rounder = lambda lst:[round(val,4)for val in lst] #lambda for rounding to 4 dec digits.
-        unique = rounder(sorted(coord))
-        if len(unique)-1:
-            spacings =  sorted(set(rounder([unique[idx]-unique[idx-1]for idx in range(1,len(unique))])))
-        else:
-            spacings = ()
-        return spacings
+        return self.geometry.spacings[0]
     @property
     def spacingY(self):
         """
         :return: Y spacing between grid points
         """
-        coord = self.uniCorY
-        rounder = lambda lst:[round(val,4)for val in lst] #lambda for rounding to 4 dec digits.
-        unique = rounder(sorted(coord))
-        if len(unique)-1:
-            spacings =  sorted(set(rounder([unique[idx]-unique[idx-1]for idx in range(1,len(unique))])))
-        else:
-            spacings = ()
-        return spacings
+        return self.geometry.spacings[1]
 
     @property
     def spacingZ(self):
         """
         :return: Z spacing between grid points
         """
-        coord = self.uniCorZ
-        rounder = lambda lst:[round(val,4)for val in lst] #lambda for rounding to 4 dec digits.
-        unique = rounder(sorted(coord))
-        if len(unique)-1:
-            spacings =  sorted(set(rounder([unique[idx]-unique[idx-1]for idx in range(1,len(unique))])))
-        else:
-            spacings = ()
-        return spacings
+        return self.geometry.spacings[2]
 
     def summaryDict(self):
         """
@@ -379,13 +633,12 @@ class RoomGrid(object):
         spaced uniformly wrt each other.
 
         """
-        extents = self.minMax
-        totalpts = len(self.ptsdict)
-        unicor = self.uniCor
-        unitest = self.testUniformSpc
+        geometry = self.geometry
+        extents = geometry.extents
+        totalpts = geometry.numPoints
 
-        # Get the length of list of unique coor in x,y,z
-        checkval = [len(coor) for coor in unitest.values()]
+        # Get the length of list of unique spacings in x,y,z
+        checkval = [len(spacings) for spacings in geometry.spacings]
 
         # return a list of true/false. False if val is 0 or 1.
         # True otherwise. evaluate to False if any one value is True
@@ -393,9 +646,9 @@ class RoomGrid(object):
 
         sumDict = {}
         sumDict['totalPoints'] = totalpts
-        sumDict['dimLimXYZ']=(extents['x'],extents['y'],extents['z'])
-        sumDict['uniqueNumPtsXYZ'] = (len(unicor['x']),len(unicor['y']),len(unicor['z']))
-        sumDict['maxGridSize']=unicor['maxgridsize']
+        sumDict['dimLimXYZ']=extents
+        sumDict['uniqueNumPtsXYZ'] = geometry.shape
+        sumDict['maxGridSize']=geometry.gridSize
         sumDict['uniformSpacing']=checkspc
 
         return sumDict
@@ -419,6 +672,149 @@ class RoomGrid(object):
                                                   gridSize,uniSpc)
 
 
+def listFiles(files,pattern):
+    """
+    Return a list of file paths.
+
+    :param files: A directory, a manifest file listing paths (one per line, relative to the manifest), or a list of
+        paths.
+    :param pattern: Pattern for selecting the files in a directory.
+    """
+    if isinstance(files,basestring):
+        if os.path.isdir(files):
+            return sorted(glob.glob(os.path.join(files,pattern)))
+        manifestDir = os.path.dirname(os.path.abspath(files))
+        with open(files) as manifest:
+            return [os.path.join(manifestDir,line.strip()) for line in manifest if line.strip()]
+    return list(files)
+
+def _readPtsArray(args):
+    """Read a points file into an array."""
+    ptsfile,useCache,cacheDir = args
+    return np.asarray(RoomGrid(ptsfile,useCache=useCache,cacheDir=cacheDir).ptsarr)
+
+class RoomGridSet(object):
+    """
+    A collection of roomgrids, for example all the points files of a building. The points of all the rooms are
+    stored in one N x 6 array (ptsarr), with the points of room i between offsets[i] and offsets[i+1]. Summaries for
+    all the rooms are calculated together, and indexing the set returns a RoomGrid that is a view of the points of
+    a single room.
+    """
+    def __init__(self,ptsfiles,pattern='*.pts',processes=1,useCache=False,cacheDir=None):
+        """
+        :param ptsfiles: A directory containing points files, a manifest file listing the paths of points files
+            (one per line, relative to the manifest), or a list of paths.
+        :param pattern: Pattern for selecting the points files in a directory. Defaults to '*.pts'.
+        :param processes: Number of processes used for reading the files. Defaults to 1, which reads the files in
+            this process. Set this to None to use a process for every cpu. See parallel.mapInPool.
+        :param useCache: Set this to True to use the binary cache of each points file. See RoomGrid.
+        :param cacheDir: Directory for the cache.
+        """
+        ptsfiles = listFiles(ptsfiles,pattern)
+        assert ptsfiles, 'No points files were found.'
+
+        args = [(ptsfile,useCache,cacheDir) for ptsfile in ptsfiles]
+        self._setArrays(parallel.mapInPool(_readPtsArray,args,processes),ptsfiles)
+
+    @classmethod
+    def fromArrays(cls,ptsarrays,names=None):
+        """
+        Create a roomgridset from a list of N x 6 points arrays, one for each room.
+
+        :param names: Optional names for the rooms. Defaults to the position of the rooms.
+        """
+        roomgridset = cls.__new__(cls)
+        roomgridset._setArrays([np.asarray(ptsarr,dtype=np.float64).reshape(-1,6) for ptsarr in ptsarrays],
+                               names if names is not None else range(len(ptsarrays)))
+        return roomgridset
+
+    def _setArrays(self,ptsarrays,names):
+        assert all(len(ptsarr) for ptsarr in ptsarrays), 'Every room should have at least one point.'
+        self.ptsfiles = list(names)
+        self.ptsarr = np.concatenate(ptsarrays)
+        self.offsets = np.cumsum([0]+[len(ptsarr) for ptsarr in ptsarrays])
+        self.roomIndex = np.repeat(np.arange(len(ptsarrays)),np.diff(self.offsets))
+        self._roomgrids = [None]*len(ptsarrays)
+
+    def __len__(self):
+        return len(self.ptsfiles)
+
+    def __getitem__(self,room):
+        """Return the RoomGrid of a room, which is a view of the shared points array."""
+        if self._roomgrids[room] is None:
+            self._roomgrids[room] = RoomGrid.fromArray(self.ptsarr[self.offsets[room]:self.offsets[room+1]])
+        return self._roomgrids[room]
+
+    def __iter__(self):
+        return (self[room] for room in range(len(self)))
+
+    @property
+    def numPoints(self):
+        """:return: An array containing the number of points in every room."""
+        return np.diff(self.offsets)
+
+    @property
+    def extents(self):
+        """
+        :return: A rooms x 3 x 2 array containing the minimum and maximum x,y,z coordinates of every room.
+        """
+        coords = self.ptsarr[:,:3]
+        return np.stack([np.minimum.reduceat(coords,self.offsets[:-1],axis=0),
+                         np.maximum.reduceat(coords,self.offsets[:-1],axis=0)],axis=2)
+
+    def _uniqueCounts(self):
+        """
+        Return two rooms x 3 arrays containing the number of unique coordinates and the number of unique spacings
+        between them (rounded to 4 decimal digits, like RoomGrid.testUniformSpc) in x,y and z for every room.
+        """
+        numUnique = np.zeros((len(self),3),dtype=np.intp)
+        numSpacings = np.zeros((len(self),3),dtype=np.intp)
+
+        for dim in range(3):
+            # Sort by room and then by coordinate, and keep the first of every repeated coordinate in a room.
+            order = np.lexsort((self.ptsarr[:,dim],self.roomIndex))
+            rooms,coords = self.roomIndex[order],self.ptsarr[order,dim]
+            first = np.r_[True,(rooms[1:]!=rooms[:-1])|(coords[1:]!=coords[:-1])]
+            rooms,coords = rooms[first],np.round(coords[first],4)
+            numUnique[:,dim] = np.bincount(rooms,minlength=len(self))
+
+            sameRoom = rooms[1:]==rooms[:-1]
+            spacingRooms,spacings = rooms[1:][sameRoom],np.round(np.diff(coords)[sameRoom],4)
+            order = np.lexsort((spacings,spacingRooms))
+            spacingRooms,spacings = spacingRooms[order],spacings[order]
+            first = np.r_[True,(spacingRooms[1:]!=spacingRooms[:-1])|(spacings[1:]!=spacings[:-1])]
+            numSpacings[:,dim] = np.bincount(spacingRooms[first[:len(spacingRooms)]],minlength=len(self))
+
+        return numUnique,numSpacings
+
+    @property
+    def uniformSpacing(self):
+        """:return: A boolean array that is True for the rooms whose points are uniformly spaced."""
+        return np.all(self._uniqueCounts()[1]<=1,axis=1)
+
+    def summaryDicts(self):
+        """
+        :return: A list containing RoomGrid.summaryDict for every room, calculated for all the rooms together.
+        """
+        numUnique,numSpacings = self._uniqueCounts()
+        extents = self.extents.tolist()
+        uniform = np.all(numSpacings<=1,axis=1).tolist()
+        numPoints = self.numPoints.tolist()
+
+        sumDicts = []
+        for room in range(len(self)):
+            uniqueNum = tuple(numUnique[room].tolist())
+            sumDict = {}
+            sumDict['totalPoints'] = numPoints[room]
+            sumDict['dimLimXYZ'] = tuple(tuple(limits) for limits in extents[room])
+            sumDict['uniqueNumPtsXYZ'] = uniqueNum
+            sumDict['maxGridSize'] = int(np.prod(uniqueNum))
+            sumDict['uniformSpacing'] = uniform[room]
+            sumDicts.append(sumDict)
+
+        return sumDicts
+
+
 if __name__ ==  '__main__':
     y = RoomGrid('examples/grid.pts')
     print(y.ptArrayXYZ)
@@ -0,0 +1,159 @@
+"""
+    Reader for Radiance matrix files, such as the output of rcontrib, dctimestep and rmtxop.
+
+    The header (if present) is parsed for NROWS, NCOLS, NCOMP, FORMAT and BYTEORDER, and the payload is loaded in
+    bulk into a numpy array. ascii payloads are parsed in a single call, while float and double payloads (-fff/-fdd
+    and -of/-od outputs) are memory-mapped, so they are not read until the values are used. ascii payloads can also
+    be parsed by a pool of processes.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import os
+import re
+
+import numpy as np
+import parallel
+import timeSeries
+
+# Weights for converting RGB radiance to illuminance.
+rgbWeights = (47.4,119.9,11.6)
+
+_headerVariable = re.compile(r'^\s*([A-Za-z_]+)=\s*(\S*)')
+_binaryTypes = {'float':'f4','double':'f8'}
+
+
+def readHeader(filePath):
+    """
+    Read the header of a Radiance matrix file.
+
+    :param filePath: Path of the file.
+    :return: A dictionary of the header variables, with the NROWS, NCOLS and NCOMP values as ints, and the offset
+        in bytes at which the data begins. The dictionary is empty and the offset is 0 if the file has no header.
+    """
+    header = {}
+    with open(filePath,'rb') as matrixFile:
+        if not matrixFile.readline().startswith(b'#?RADIANCE'):
+            return header,0
+
+        for line in iter(matrixFile.readline,b''):
+            line = line.decode('ascii','replace')
+            if not line.strip():
+                break
+            variable = _headerVariable.match(line)
+            if variable:
+                header[variable.group(1)] = variable.group(2)
+        offset = matrixFile.tell()
+
+    for key in ('NROWS','NCOLS','NCOMP'):
+        if key in header:
+            header[key] = int(header[key])
+
+    return header,offset
+
+
+def _readAsciiRows(filePath,offset,valuesPerRow,nrows,processes,sharedDirectory):
+    """
+    Parse an ascii payload with a pool of processes if every line of it is a row, see parallel.parseRows. Return
+    None if it is not, or if the lines differ in the number of values.
+    """
+    starts,ends = timeSeries.lineOffsets(filePath)
+    inPayload = starts>=offset
+    starts,ends = starts[inPayload],ends[inPayload]
+    if not len(starts) or (nrows is not None and len(starts) != nrows):
+        return None
+
+    if not valuesPerRow:
+        with open(filePath,'rb') as matrixFile:
+            matrixFile.seek(starts[0])
+            valuesPerRow = len(matrixFile.read(ends[0]-starts[0]).split())
+    try:
+        return parallel.parseRows(filePath,starts,ends,valuesPerRow,timeColumns=0,processes=processes,
+                                  directory=sharedDirectory)
+    except ValueError:
+        return None
+
+
+def readRadianceMatrix(filePath,mmap=True,processes=1,sharedDirectory=None):
+    """
+    Read a Radiance matrix file.
+
+    :param filePath: Path of the file.
+    :param mmap: If True (default), binary payloads are memory-mapped instead of read into memory.
+    :param processes: Number of processes for parsing ascii payloads. Defaults to 1. With more than one process,
+        payloads that have a row on every line are divided into byte ranges that are parsed in parallel into a
+        temporary memory-mapped array. Its file is removed when the array is garbage collected.
+    :param sharedDirectory: Directory for the temporary memory-mapped array. Defaults to the temporary directory of
+        the system.
+    :return: The header dictionary (see readHeader) and an array of NROWS x NCOLS values, or NROWS x NCOLS x NCOMP
+        values if there is more than one component. For an ascii file without a header, the array has a row for
+        every line of the file.
+    :raises ValueError: If the payload does not fit the shape in the header, or if ascii lines contain text or
+        differ in the number of values.
+    """
+    header,offset = readHeader(filePath)
+    fmt = header.get('FORMAT','ascii')
+    ncomp = header.get('NCOMP',1)
+    nrows,ncols = header.get('NROWS'),header.get('NCOLS')
+
+    if fmt in _binaryTypes:
+        byteOrder = '>' if header.get('BYTEORDER','').lower().startswith('big') else '<'
+        dtype = np.dtype(byteOrder+_binaryTypes[fmt])
+        assert ncols, 'The number of columns(NCOLS) needs to be in the header of the binary file %s.'%filePath
+
+        valuesPerRow = ncols*ncomp
+        numValues = (os.path.getsize(filePath)-offset)//dtype.itemsize
+        if nrows is None:
+            nrows = numValues//valuesPerRow
+        if numValues < nrows*valuesPerRow:
+            raise ValueError('The file %s contains %s values instead of %s.'%(filePath,numValues,nrows*valuesPerRow))
+
+        if mmap:
+            data = np.memmap(filePath,dtype=dtype,mode='r',offset=offset,shape=(nrows,valuesPerRow))
+        else:
+            with open(filePath,'rb') as matrixFile:
+                matrixFile.seek(offset)
+                data = np.fromfile(matrixFile,dtype=dtype,count=nrows*valuesPerRow).reshape(nrows,valuesPerRow)
+
+    elif fmt == 'ascii':
+        data = _readAsciiRows(filePath,offset,ncols and ncols*ncomp,nrows,processes,sharedDirectory) \
+            if processes>1 else None
+        if data is not None:
+            ncols = ncols or data.shape[1]//ncomp
+        else:
+            with open(filePath,'rb') as matrixFile:
+                matrixFile.seek(offset)
+                text = matrixFile.read().decode('ascii')
+            data = np.fromstring(text,dtype=np.float64,sep=' ')
+
+            lines = [line for line in text.splitlines() if line.strip()]
+            if ncols:
+                valuesPerRow = ncols*ncomp
+            else:
+                # Without a header, every line is a row.
+                valuesPerRow = len(lines[0].split()) if lines else 0
+                ncols = valuesPerRow//ncomp
+
+            if not valuesPerRow or data.size%valuesPerRow or \
+                    (nrows is not None and data.size != nrows*valuesPerRow) or \
+                    (header.get('NCOLS') is None and data.size != len(lines)*valuesPerRow):
+                raise ValueError('The data in %s could not be read as a matrix of %s values per row. It might contain '
+                                 'text or rows of different lengths.'%(filePath,valuesPerRow))
+            data = data.reshape(-1,valuesPerRow)
+
+    else:
+        raise ValueError('The format %s of %s is not supported.'%(fmt,filePath))
+
+    if ncomp > 1:
+        data = data.reshape(len(data),ncols,ncomp)
+
+    return header,data
+
+
+def illuminanceFromRGB(data):
+    """
+    Convert a NROWS x NCOLS x 3 array of RGB values, as returned by readRadianceMatrix, to illuminance.
+    """
+    # Weighted in the same order as the legacy per-value loops, so that truncated results match exactly.
+    return data[...,0]*rgbWeights[0]+data[...,1]*rgbWeights[1]+data[...,2]*rgbWeights[2]
@@ -0,0 +1,135 @@
+"""
+    Neighbours and connected regions of grid points.
+
+    Points are neighbours if they are next to each other in gridMatrixFull, ie their positions in the unique x,y,z
+    coordinates differ by one. The neighbours are stored in compressed sparse row form: the neighbours of point i
+    are indices[indptr[i]:indptr[i+1]]. Connected regions of a mask are found by repeatedly joining the labels of
+    neighbouring points and compressing the labels, which takes a handful of numpy passes even for large grids.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import itertools
+import numpy as np
+
+
+def gridCellPoints(cellIndex,numCells):
+    """
+    Return an array with the index of the point in every grid cell, or -1 for the cells without a point. If a cell
+    contains several points, for example because a coordinate is repeated in the points file, the first of them is
+    kept.
+
+    :param cellIndex: An integer array containing the cell of every point, as returned by RoomGrid.gridCellIndex.
+    :param numCells: The number of cells in the grid.
+    """
+    cellPoints = np.full(numCells,-1,dtype=np.intp)
+    cells,firstPoints = np.unique(cellIndex,return_index=True)
+    cellPoints[cells] = firstPoints
+    return cellPoints
+
+
+def gridAdjacency(gridIndices,shape,diagonal=False):
+    """
+    Find the neighbours of every point in a grid.
+
+    :param gridIndices: A N x 3 array containing the position of each point in the unique x,y,z coordinates, as
+        returned by RoomGrid.gridIndices.
+    :param shape: The number of unique x,y,z coordinates.
+    :param diagonal: If True, points that touch diagonally are neighbours as well (8 neighbours in a plane instead
+        of 4).
+    :return: The arrays indptr and indices of the neighbours. A cell that contains several points is represented
+        by the first of them (see gridCellPoints), so only that point is a neighbour of the points around it.
+    """
+    shape = np.asarray(shape)
+    numPoints = len(gridIndices)
+
+    cellPoints = gridCellPoints(np.ravel_multi_index(gridIndices.T,shape),int(np.prod(shape)))
+
+    steps = [(-1,0,1) if size>1 else (0,) for size in shape]
+    offsets = [offset for offset in itertools.product(*steps) if any(offset)]
+    if not diagonal:
+        offsets = [offset for offset in offsets if sum(map(abs,offset))==1]
+
+    sources,targets = [],[]
+    for offset in offsets:
+        neighbourCells = gridIndices+offset
+        valid = np.all((neighbourCells>=0)&(neighbourCells<shape),axis=1)
+        neighbours = np.full(numPoints,-1,dtype=np.intp)
+        neighbours[valid] = cellPoints[np.ravel_multi_index(neighbourCells[valid].T,shape)]
+        valid = neighbours>=0
+        sources.append(np.flatnonzero(valid))
+        targets.append(neighbours[valid])
+
+    sources = np.concatenate(sources) if sources else np.zeros(0,dtype=np.intp)
+    targets = np.concatenate(targets) if targets else np.zeros(0,dtype=np.intp)
+
+    order = np.argsort(sources,kind='mergesort')
+    indptr = np.r_[0,np.cumsum(np.bincount(sources,minlength=numPoints))]
+    return indptr,targets[order]
+
+
+def _minimumAt(labels,targets,values):
+    """Set labels[target] to the smallest of its current value and all the values given for that target."""
+    order = np.lexsort((values,targets))
+    targets,values = targets[order],values[order]
+    first = np.r_[True,targets[1:]!=targets[:-1]]
+    labels[targets[first]] = np.minimum(labels[targets[first]],values[first])
+
+
+def labelRegions(mask,indptr,indices):
+    """
+    Label the connected regions of the points that are True in mask.
+
+    :param mask: A boolean array with a value for every point.
+    :param indptr: Neighbours of the points, as returned by gridAdjacency.
+    :param indices: Neighbours of the points, as returned by gridAdjacency.
+    :return: An array with the region of every point, numbered from 0 in order of decreasing size, and -1 for the
+        points that are not in mask, along with an array containing the number of points in every region.
+    """
+    mask = np.asarray(mask,dtype=bool)
+    numPoints = len(mask)
+
+    sources = np.repeat(np.arange(numPoints),np.diff(indptr))
+    inMask = mask[sources]&mask[indices]
+    sources,targets = sources[inMask],indices[inMask]
+
+    # Every point starts as its own region. Each pass points the root of every region at the smallest neighbouring
+    # root, and then compresses the labels so that every point refers to its root directly.
+    labels = np.arange(numPoints)
+    while True:
+        sourceRoots,targetRoots = labels[sources],labels[targets]
+        joined = labels.copy()
+        _minimumAt(joined,sourceRoots,targetRoots)
+        _minimumAt(joined,targetRoots,sourceRoots)
+        while True:
+            compressed = joined[joined]
+            if np.array_equal(compressed,joined):
+                break
+            joined = compressed
+        if np.array_equal(joined,labels):
+            break
+        labels = joined
+
+    roots,regionLabels,sizes = np.unique(labels[mask],return_inverse=True,return_counts=True)
+    bySize = np.argsort(-sizes,kind='mergesort')
+    rank = np.empty(len(roots),dtype=np.intp)
+    rank[bySize] = np.arange(len(roots))
+
+    pointRegions = np.full(numPoints,-1,dtype=np.intp)
+    pointRegions[mask] = rank[regionLabels]
+    return pointRegions,sizes[bySize]
+
+
+def cellWidths(uniqueCoords):
+    """
+    Return the width of the grid cell around every unique coordinate: half the distance between its neighbouring
+    coordinates, or the full distance to the only neighbour at the ends. A lone coordinate has a width of 0.
+    """
+    uniqueCoords = np.asarray(uniqueCoords,dtype=np.float64)
+    if len(uniqueCoords)<2:
+        return np.zeros(len(uniqueCoords))
+    edges = np.r_[uniqueCoords[0]-(uniqueCoords[1]-uniqueCoords[0])/2,
+                  (uniqueCoords[1:]+uniqueCoords[:-1])/2,
+                  uniqueCoords[-1]+(uniqueCoords[-1]-uniqueCoords[-2])/2]
+    return np.diff(edges)
@@ -0,0 +1,306 @@
+"""
+    Spatial queries on grid points.
+
+    SpatialIndex sorts the points into a uniform grid of buckets. Nearest-point, radius and box queries for a batch of
+    probe points are answered by looking up the buckets around every probe with numpy, without looping over the
+    points in python. The buckets are looked up a row at a time, since the points of a row of buckets are next to
+    each other in the sorted order.
+
+    pointsInPolygon tests a set of points against a 2d polygon, one polygon edge at a time.
+"""
+
+from __future__ import print_function
+from __future__ import division
+
+import itertools
+import numpy as np
+
+# The largest number of probe x row pairs that are looked up at once. The probes are processed in chunks of this
+# size, so that the memory used by a query does not grow with the number of probes or the search radius.
+_maxPairs = 1<<18
+
+
+class SpatialIndex(object):
+    """
+    A uniform bucket grid over a set of 2d or 3d points. The queries return indices into the array of points that
+    the index was created with.
+    """
+    def __init__(self,coords,cellSize=None):
+        """
+        :param coords: A N x 2 or N x 3 array of point coordinates.
+        :param cellSize: The size of the buckets. For points that are uniformly spaced, the spacing is a good value.
+            If None (default), the size is chosen so that there is about one point in every bucket.
+        """
+        coords = np.asarray(coords,dtype=np.float64)
+        assert coords.ndim == 2 and len(coords), 'The coordinates should be a non-empty N x 2 or N x 3 array.'
+
+        self.coords = coords
+        self.origin = coords.min(axis=0)
+        self.upper = coords.max(axis=0)
+        extent = self.upper-self.origin
+
+        if not cellSize:
+            # Spread the points over the dimensions that have an extent.
+            spread = extent[extent>0]
+            cellSize = (np.prod(spread)/len(coords))**(1/len(spread)) if len(spread) else 1.0
+        self.cellSize = float(cellSize)
+
+        self.shape = np.floor(extent/self.cellSize).astype(np.int64)+1
+
+        keys = self._keys(self._cells(coords))
+        self.order = np.argsort(keys,kind='mergesort')
+        self.sortedKeys = keys[self.order]
+
+        # The rows of buckets run along the last axis that has more than one bucket. The buckets of a row have
+        # consecutive keys, as the axes after it have a single bucket.
+        multipleBuckets = np.flatnonzero(self.shape>1)
+        self._rowAxis = multipleBuckets[-1] if len(multipleBuckets) else 0
+
+        self._xorder = None
+        self._summedCounts = None
+
+    def __len__(self):
+        return len(self.coords)
+
+    def _asProbes(self,probes):
+        probes = np.asarray(probes,dtype=np.float64)
+        if probes.ndim == 1:
+            probes = probes.reshape(1,-1)
+        assert probes.shape[1] == self.coords.shape[1], \
+            'The probe points should have %s coordinates, not %s.'%(self.coords.shape[1],probes.shape[1])
+        return probes
+
+    def _cells(self,coords):
+        return np.floor((coords-self.origin)/self.cellSize).astype(np.int64)
+
+    def _keys(self,cells):
+        return np.ravel_multi_index(cells.T,self.shape)
+
+    def _rows(self,ring,innerRing=-1):
+        """
+        Return the buckets that are more than innerRing and at most ring buckets away from a bucket, along the axis on
+        which they are furthest, as rows: the offsets of the rows (0 along the row axis), and the offsets of the
+        first and last bucket of every row along the row axis. Offsets that would leave the bucket grid from every
+        bucket are left out.
+        """
+        limits = np.minimum(ring,self.shape-1)
+        rowLimit = limits[self._rowAxis]
+        limits[self._rowAxis] = 0
+        offsetRanges = [np.arange(-limit,limit+1) for limit in limits]
+        offsets = np.stack([axisOffsets.ravel() for axisOffsets in np.meshgrid(*offsetRanges,indexing='ij')],axis=1)
+
+        outer = np.abs(offsets).max(axis=1)>innerRing
+        rowOffsets,firsts,lasts = [offsets[outer]],[np.full(outer.sum(),-rowLimit)],[np.full(outer.sum(),rowLimit)]
+        if innerRing<rowLimit:
+            # The other rows cross the inner block, so only their two ends are left.
+            inner = offsets[~outer]
+            rowOffsets += [inner,inner]
+            firsts += [np.full(len(inner),-rowLimit),np.full(len(inner),innerRing+1)]
+            lasts += [np.full(len(inner),-innerRing-1),np.full(len(inner),rowLimit)]
+        return np.concatenate(rowOffsets),np.concatenate(firsts),np.concatenate(lasts)
+
+    def _candidates(self,probeCells,rows):
+        """
+        For chunks of the probes, yield two arrays: the position of the probe and the index of the point, for every
+        point that lies in one of the rows (see _rows) around the bucket of a probe. The pairs are sorted by probe.
+        """
+        rowOffsets,firsts,lasts = rows
+        if not len(rowOffsets):
+            return
+        chunkSize = max(1,_maxPairs//len(rowOffsets))
+
+        for chunkStart in xrange(0,len(probeCells),chunkSize):
+            chunkCells = probeCells[chunkStart:chunkStart+chunkSize]
+            cells = chunkCells[:,None,:]+rowOffsets[None,:,:]
+            firstCells = np.maximum(chunkCells[:,self._rowAxis,None]+firsts,0)
+            lastCells = np.minimum(chunkCells[:,self._rowAxis,None]+lasts,self.shape[self._rowAxis]-1)
+            valid = np.all((cells>=0)&(cells<self.shape),axis=2)&(firstCells<=lastCells)
+            probePositions = np.nonzero(valid)[0]
+
+            cells = cells[valid]
+            cells[:,self._rowAxis] = firstCells[valid]
+            starts = np.searchsorted(self.sortedKeys,self._keys(cells),side='left')
+            cells[:,self._rowAxis] = lastCells[valid]
+            counts = np.searchsorted(self.sortedKeys,self._keys(cells),side='right')-starts
+
+            # Expand every (start,count) range of the sorted points into individual positions.
+            positions = np.arange(counts.sum())+np.repeat(starts-np.cumsum(counts)+counts,counts)
+            yield chunkStart+np.repeat(probePositions,counts),self.order[positions]
+
+    def _countInBlocks(self,probeCells,rings):
+        """
+        Return the number of points in the buckets within rings buckets of every probe bucket. The counts are taken
+        from a table of the number of points summed over the buckets, with a lookup for every corner of a block.
+        """
+        if self._summedCounts is None:
+            summed = np.zeros(self.shape+1,dtype=np.int64)
+            summed[(slice(1,None),)*len(self.shape)] = \
+                np.bincount(self.sortedKeys,minlength=int(np.prod(self.shape))).reshape(self.shape)
+            for axis in range(len(self.shape)):
+                np.cumsum(summed,axis=axis,out=summed)
+            self._summedCounts = summed
+
+        low = np.clip(probeCells-rings[:,None],0,self.shape)
+        high = np.clip(probeCells+rings[:,None]+1,0,self.shape)
+        counts = np.zeros(len(probeCells),dtype=np.int64)
+        for corner in itertools.product((False,True),repeat=len(self.shape)):
+            sign = -1 if (len(corner)-sum(corner))%2 else 1
+            counts += sign*self._summedCounts[tuple(np.where(corner,high,low).T)]
+        return counts
+
+    def _firstOccupiedRings(self,probeCells):
+        """Return the smallest number of rings of buckets around every probe bucket that contains a point."""
+        low = np.zeros(len(probeCells),dtype=np.int64)
+        high = np.full(len(probeCells),self.shape.max()-1,dtype=np.int64)
+        while np.any(low<high):
+            middle = (low+high)//2
+            occupied = self._countInBlocks(probeCells,middle)>0
+            low,high = np.where(occupied,low,middle+1),np.where(occupied,middle,high)
+        return low
+
+    def nearest(self,probes,returnDistance=False):
+        """
+        Find the nearest point to each probe. The search starts with the smallest block of buckets around a probe
+        that contains a point, and is widened once to the distance of the nearest point found, so the empty buckets
+        around a probe far from the points are not looked up.
+
+        :param probes: A M x 2 or M x 3 array of probe coordinates.
+        :param returnDistance: If True, also return the distance to the nearest point.
+        :return: An array with the index of the nearest point for every probe (and an array of distances if
+            returnDistance is True).
+        """
+        probes = self._asProbes(probes)
+        nearestIdx = np.full(len(probes),-1,dtype=np.intp)
+        nearestDist2 = np.full(len(probes),np.inf)
+
+        probeCells = np.clip(self._cells(probes),0,self.shape-1)
+        pending = np.arange(len(probes))
+        rings = self._firstOccupiedRings(probeCells)
+        innerRings = np.full(len(probes),-1,dtype=np.int64)
+
+        while len(pending):
+            # The probes that search the same rows are looked up together.
+            for innerRing,ring in set(zip(innerRings[pending].tolist(),rings[pending].tolist())):
+                group = pending[(innerRings[pending]==innerRing)&(rings[pending]==ring)]
+                for pairProbe,pairPoint in self._candidates(probeCells[group],self._rows(ring,innerRing)):
+                    if not len(pairProbe):
+                        continue
+                    dist2 = ((self.coords[pairPoint]-probes[group[pairProbe]])**2).sum(axis=1)
+                    order = np.lexsort((dist2,pairProbe))
+                    pairProbe,pairPoint,dist2 = pairProbe[order],pairPoint[order],dist2[order]
+                    first = np.r_[True,pairProbe[1:]!=pairProbe[:-1]]
+                    better = dist2[first]<nearestDist2[group[pairProbe[first]]]
+                    updated = group[pairProbe[first][better]]
+                    nearestIdx[updated] = pairPoint[first][better]
+                    nearestDist2[updated] = dist2[first][better]
+
+            # A point outside the searched block of buckets lies beyond one of its faces, so it is at least as far
+            # away as that face in that dimension, and as far away as the bounding box of the points in the other
+            # dimensions. Faces on the boundary of the bucket grid have nothing beyond them.
+            pendingProbes = probes[pending]
+            blockLow = probeCells[pending]-rings[pending,None]
+            blockHigh = probeCells[pending]+rings[pending,None]
+            lowGap = np.where(blockLow>0,pendingProbes-(self.origin+blockLow*self.cellSize),np.inf)
+            highGap = np.where(blockHigh<self.shape-1,self.origin+(blockHigh+1)*self.cellSize-pendingProbes,np.inf)
+            outside = np.maximum(self.origin-pendingProbes,0)+np.maximum(pendingProbes-self.upper,0)
+            outside2 = outside**2
+            searched2 = (outside2.sum(axis=1)[:,None]-outside2+np.minimum(lowGap,highGap)**2).min(axis=1)
+
+            pending = pending[nearestDist2[pending]>searched2]
+            if not len(pending):
+                break
+
+            # Widen the block until its faces are as far from the probe as the nearest point found.
+            position = (probes[pending]-self.origin)/self.cellSize-probeCells[pending]
+            slack = np.maximum(-position,position-1)[:,self.shape>1].max(axis=1)
+            neededRings = np.ceil(np.sqrt(nearestDist2[pending])/self.cellSize+slack).astype(np.int64)
+            innerRings[pending],rings[pending] = rings[pending],np.maximum(rings[pending]+1,neededRings)
+
+        if returnDistance:
+            return nearestIdx,np.sqrt(nearestDist2)
+        return nearestIdx
+
+    def withinRadius(self,probes,radius):
+        """
+        Find all the points within a distance of each probe.
+
+        :param probes: A M x 2 or M x 3 array of probe coordinates.
+        :param radius: The search radius. Points at exactly this distance are included.
+        :return: A list of M arrays, each containing the sorted indices of the points near a probe.
+        """
+        probes = self._asProbes(probes)
+        rows = self._rows(int(np.ceil(radius/self.cellSize)))
+        # Probes outside the bucket grid are moved to its nearest bucket. The rows around that bucket include all
+        # the buckets within the radius of the probe, and the points that are too far away are dropped below.
+        # Without this, a probe that is off a grid with a single bucket along an axis (a flat grid, for example)
+        # would find no buckets at all.
+        probeCells = np.clip(self._cells(probes),0,self.shape-1)
+
+        nearProbes,nearPoints = [np.zeros(0,dtype=np.intp)],[np.zeros(0,dtype=np.intp)]
+        for pairProbe,pairPoint in self._candidates(probeCells,rows):
+            inside = ((self.coords[pairPoint]-probes[pairProbe])**2).sum(axis=1)<=radius**2
+            pairProbe,pairPoint = pairProbe[inside],pairPoint[inside]
+            order = np.lexsort((pairPoint,pairProbe))
+            nearProbes.append(pairProbe[order])
+            nearPoints.append(pairPoint[order])
+
+        # The chunks follow the order of the probes, so the joined pairs are still sorted by probe.
+        splits = np.searchsorted(np.concatenate(nearProbes),np.arange(1,len(probes)))
+        return np.split(np.concatenate(nearPoints),splits)
+
+    def inBox(self,minCorners,maxCorners):
+        """
+        Find all the points inside one or more axis-aligned boxes.
+
+        :param minCorners: A M x 2 or M x 3 array with the lower corner of each box.
+        :param maxCorners: A M x 2 or M x 3 array with the upper corner of each box. Points on the faces of a box
+            are included.
+        :return: A list of M arrays, each containing the sorted indices of the points inside a box.
+        """
+        minCorners,maxCorners = self._asProbes(minCorners),self._asProbes(maxCorners)
+
+        if self._xorder is None:
+            self._xorder = np.argsort(self.coords[:,0],kind='mergesort')
+        sortedX = self.coords[self._xorder,0]
+
+        starts = np.searchsorted(sortedX,minCorners[:,0],side='left')
+        ends = np.searchsorted(sortedX,maxCorners[:,0],side='right')
+
+        pointsInBoxes = []
+        for start,end,low,high in zip(starts,ends,minCorners,maxCorners):
+            candidates = self._xorder[start:end]
+            candidateCoords = self.coords[candidates]
+            inside = np.all((candidateCoords>=low)&(candidateCoords<=high),axis=1)
+            pointsInBoxes.append(np.sort(candidates[inside]))
+        return pointsInBoxes
+
+
+def pointsInPolygon(coords,polygon):
+    """
+    Test which points lie inside a polygon in plan (x,y), with the even-odd rule.
+
+    :param coords: A N x 2 or N x 3 array of point coordinates. Only x and y are used.
+    :param polygon: A sequence of (x,y) or (x,y,z) vertices. The polygon is closed automatically.
+    :return: A boolean array of length N.
+    """
+    coords = np.asarray(coords,dtype=np.float64)
+    polygon = np.asarray(polygon,dtype=np.float64)[:,:2]
+    assert len(polygon)>2, 'A polygon needs at least 3 vertices.'
+
+    inside = np.zeros(len(coords),dtype=bool)
+
+    # Only test the points inside the bounding box of the polygon.
+    inBounds = np.all((coords[:,:2]>=polygon.min(axis=0))&(coords[:,:2]<=polygon.max(axis=0)),axis=1)
+    x,y = coords[inBounds,0],coords[inBounds,1]
+    crossings = np.zeros(len(x),dtype=bool)
+
+    for (xa,ya),(xb,yb) in zip(polygon,np.roll(polygon,-1,axis=0)):
+        if ya == yb:
+            continue
+        # Count the edges that a ray from each point in the +x direction crosses.
+        crosses = (ya>y)!=(yb>y)
+        crossings ^= crosses&(x<xa+(y-ya)*(xb-xa)/(yb-ya))
+
+    inside[inBounds] = crossings
+    return inside
+
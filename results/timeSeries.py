@@ -1,7 +1,7 @@
 """
     Base module for processing all timeseries based data.
     Use this as the base module for processing illfiles,bf.txt,weafiles.
-    Dependencies: none
+    Dependencies: numpy
     Python version : 2.7
 """
 
@@ -15,6 +15,7 @@ logging.basicConfig(format='%(asctime)s -%(levelname)s module:%(module)s functio
 
 import sys
 import datetime as  _dt
+import numpy as np
 
 def timeStamp(mval,dval,tval,yearval=2015):
         """return _dt object from month,date and time values"""
@@ -31,6 +32,209 @@ def readTextFile(filename,delimiter=False):
                 else:
                     yield lines.split()
 
+def countLines(filename,blockSize=1<<20):
+        """Return the number of lines in a file, counting newlines in blocks instead of splitting the lines."""
+        numLines = 0
+        lastBlock = b''
+        with open(filename,'rb') as textFile:
+            for block in iter(lambda: textFile.read(blockSize),b''):
+                numLines += block.count(b'\n')
+                lastBlock = block
+        if lastBlock and not lastBlock.endswith(b'\n'):
+            numLines += 1
+        return numLines
+
+def lineOffsets(filename,blockSize=1<<20):
+        """
+        Return the byte offsets at which the lines of a file begin and end, found by scanning the file for newlines
+        a block at a time. The end of a line includes its newline.
+
+        :return: Two arrays, starts and ends, with a value for every line.
+        """
+        newlines = []
+        fileSize = 0
+        with open(filename,'rb') as textFile:
+            for block in iter(lambda: textFile.read(blockSize),b''):
+                newlines.append(np.flatnonzero(np.frombuffer(block,dtype=np.uint8) == ord(b'\n'))+(fileSize+1))
+                fileSize += len(block)
+
+        ends = np.concatenate(newlines).astype(np.int64) if newlines else np.zeros(0,dtype=np.int64)
+        if fileSize and (not len(ends) or ends[-1] != fileSize):
+            ends = np.append(ends,fileSize)
+        starts = np.r_[0,ends[:-1]].astype(np.int64)[:len(ends)]
+        return starts,ends
+
+def byteRanges(starts,ends,parts):
+        """
+        Divide rows into parts with about the same number of bytes.
+
+        :param starts: The byte offsets at which the rows begin, in order, as returned by lineOffsets.
+        :param ends: The byte offsets at which the rows end.
+        :param parts: The number of parts. Fewer parts are returned if there are fewer rows.
+        :return: A list of (firstRow,stopRow,startByte,endByte) for every part. The bytes from startByte to endByte
+            contain the rows from firstRow up to stopRow, and any lines between them that are not in starts.
+        """
+        if not len(starts):
+            return []
+        targets = np.linspace(starts[0],ends[-1],max(1,parts)+1)[1:-1]
+        breaks = np.unique(np.r_[0,np.searchsorted(starts,targets),len(starts)])
+        return [(int(first),int(stop),int(starts[first]),int(ends[stop-1]))
+                for first,stop in zip(breaks[:-1],breaks[1:])]
+
+class HourCorrection(object):
+        """
+        The hour correction of TimeArray.readfile, applied to the hours a chunk at a time: if the first (non-zero)
+        hour is 1.0, the hours are 1,2,3..24 and are moved back by 0.5 from the first 2.0 onwards, and the first hour
+        becomes 0.5. The first hour is not changed by apply; firstHourFixed is set to True when it should be.
+        """
+        def __init__(self):
+            self.firstHour = None
+            self.shifting = False
+            self.firstHourFixed = False
+
+        def apply(self,hours):
+            """Return a corrected copy of the next chunk of hours."""
+            hours = np.array(hours,dtype=np.float64)
+            if self.shifting:
+                hours -= 0.5
+                return hours
+
+            searchFrom = 0
+            if self.firstHour is None:
+                nonZero = np.flatnonzero(hours)
+                if not len(nonZero):
+                    return hours
+                self.firstHour = hours[nonZero[0]]
+                searchFrom = nonZero[0]+1
+
+            if self.firstHour == 1.0:
+                secondHours = np.flatnonzero(hours[searchFrom:] == 2.0)
+                if len(secondHours):
+                    hours[searchFrom+secondHours[0]:] -= 0.5
+                    self.shifting = self.firstHourFixed = True
+            return hours
+
+def fixHours(hours):
+        """
+        Apply the hour correction of TimeArray.readfile to an array of hours. See HourCorrection.
+
+        :return: The corrected hours and a flag that is True if the first hour was changed.
+        """
+        correction = HourCorrection()
+        hours = correction.apply(hours)
+        if correction.firstHourFixed:
+            hours[0] = 0.5
+        return hours,correction.firstHourFixed
+
+def hourWindow(hours,startTime=None,endTime=None):
+        """
+        Return startTime and endTime, with the defaults used for the ill files: the smallest and largest of the first
+        30 hours.
+        """
+        possibleHours = np.asarray(hours[:30])
+        if startTime is None:
+            startTime = possibleHours.min()
+        if endTime is None:
+            endTime = possibleHours.max()
+        return startTime,endTime
+
+def indexer(indices):
+        """
+        Return a slice equivalent to a sorted array of indices when the indices are evenly spaced (for example all the
+        hours of a month, or a particular hour of every day of a year), so that indexing with it returns a view. Other
+        indices are returned as they are.
+        """
+        indices = np.asarray(indices)
+        if not len(indices):
+            return slice(0,0)
+        if len(indices) == 1:
+            return slice(int(indices[0]),int(indices[0])+1)
+        step = int(indices[1]-indices[0])
+        if step>0 and np.all(np.diff(indices) == step):
+            return slice(int(indices[0]),int(indices[-1])+1,step)
+        return indices
+
+# The day of the year before the first day of every month, in a year that is not a leap year.
+_monthStarts = np.cumsum([0,31,28,31,30,31,30,31,31,30,31,30])
+
+class TimeIndex(object):
+        """
+        Calendar arrays for the timestamps of a time series, built once so that hours can be selected without going
+        through datetime objects. The arrays are month, day, hour (as in the file, with the hour correction applied),
+        hourOfDay (the hour of the timestamp, as in datetime.hour), dayOfYear, weekday (0 is Monday) and hourOfYear.
+        Weekdays are those of yearval, which is not a leap year.
+
+        The select methods return slices where possible (see indexer), so that selecting rows of an hours x points
+        array with them returns views. Lookups are computed the first time they are used and then stored.
+        """
+        def __init__(self,months,days,hours,yearval=2015):
+            assert len(months) == len(days) == len(hours), 'months, days and hours should have the same length.'
+            assert yearval%4, 'The year(%s) cannot be a leap year.'%yearval
+
+            self.month = np.asarray(months)
+            self.day = np.asarray(days)
+            self.hour = np.asarray(hours,dtype=np.float64)
+            self.yearval = yearval
+
+            self.hourOfDay = np.floor(self.hour).astype(np.intp)
+            self.dayOfYear = _monthStarts[self.month.astype(np.intp)-1]+self.day.astype(np.intp)
+            self.weekday = (self.dayOfYear-1+_dt.date(yearval,1,1).weekday())%7
+            self.hourOfYear = (self.dayOfYear-1)*24+self.hourOfDay
+
+            self._groups = {}
+            self._windows = {}
+
+        def __len__(self):
+            return len(self.hour)
+
+        def sameAs(self,other):
+            """Return True if other has the same timestamps."""
+            return other is self or (len(other) == len(self) and np.array_equal(other.month,self.month) and
+                                     np.array_equal(other.day,self.day) and np.array_equal(other.hour,self.hour))
+
+        def hourWindow(self,startTime=None,endTime=None):
+            """
+            Return the indices of the hours between startTime and endTime (limits included). These default to the
+            smallest and largest of the first 30 hours, see hourWindow.
+            """
+            startTime,endTime = hourWindow(self.hour,startTime,endTime)
+            if (startTime,endTime) not in self._windows:
+                self._windows[(startTime,endTime)] = np.flatnonzero((startTime<=self.hour)&(self.hour<=endTime))
+            return self._windows[(startTime,endTime)]
+
+        def _select(self,name,value):
+            """Return an indexer of the hours for which the array called name is equal to value."""
+            if name not in self._groups:
+                values = getattr(self,name)
+                order = np.argsort(values,kind='mergesort')
+                keys,starts = np.unique(values[order],return_index=True)
+                self._groups[name] = dict((key,indexer(indices)) for key,indices in
+                                          zip(keys.tolist(),np.split(order,starts[1:])))
+            groups = self._groups[name]
+            assert value in groups, 'The %s %s was not found in the timestamps. The values in the current data set ' \
+                                    'are: %s'%(name,value," ".join(map(str,sorted(groups))))
+            return groups[value]
+
+        def selectMonth(self,month):
+            """Return an indexer of the hours of a month (1 to 12)."""
+            return self._select('month',month)
+
+        def selectHourOfDay(self,hour):
+            """Return an indexer of the hours whose timestamps have the hour of the day hour (0 to 23)."""
+            return self._select('hourOfDay',hour)
+
+        def selectWeekday(self,weekday):
+            """Return an indexer of the hours of a day of the week (0 is Monday and 6 is Sunday)."""
+            return self._select('weekday',weekday)
+
+        def selectHourOfYear(self,hourOfYear):
+            """Return an indexer of the hour of the year hourOfYear (0 to 8759)."""
+            return self._select('hourOfYear',hourOfYear)
+
+        def selectDate(self,month,day):
+            """Return an indexer of the hours of a date."""
+            return self._select('dayOfYear',int(_monthStarts[int(month)-1]+day))
+
 class TimeArray(object):
     """Base class for all the time series data. Use this to process illfiles, wea files etc."""
 
@@ -0,0 +1,74 @@
+"""
+    Checks of results.spatial against brute force searches over all the distances. Run with python testSpatial.py.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+from results import spatial
+from results.spatial import SpatialIndex
+
+
+def bruteForceWithinRadius(coords,probes,radius):
+    """Find the points within radius of each probe by measuring every distance."""
+    dist2 = ((np.asarray(coords)[None,:,:]-np.asarray(probes)[:,None,:])**2).sum(axis=2)
+    return [np.flatnonzero(row<=radius**2) for row in dist2]
+
+
+def bruteForceNearestDistance(coords,probes):
+    """Find the distance from each probe to the nearest point by measuring every distance."""
+    dist2 = ((np.asarray(coords)[None,:,:]-np.asarray(probes)[:,None,:])**2).sum(axis=2)
+    return np.sqrt(dist2.min(axis=1))
+
+
+def grids():
+    """Yield a name, the points and the probes of grids with empty regions and with axes that have a single bucket."""
+    randomState = np.random.RandomState(0)
+    offPlaneProbes = np.array([[10,10,0.75],[10,10,1.2],[-0.3,5,0.76],[25,25,0],[5.2,2.4,0.7]])
+
+    flatGrid = np.array([(x,y,0.76) for x in np.arange(0,20,0.5) for y in np.arange(0,20,0.5)])
+    corridor = np.array([(x,2.0,0.76) for x in np.arange(0,30,0.5)])
+    scattered = randomState.rand(500,3)*[20,10,3]
+    lShaped = np.array([(x,y,0.76) for x in np.arange(0,20,0.25) for y in np.arange(0,20,0.25) if x<6 or y<6])
+    notchProbes = np.c_[randomState.uniform(7,25,50),randomState.uniform(7,25,50),np.full(50,0.76)]
+
+    for name,coords in (('flat grid',flatGrid),('corridor',corridor),('scattered points',scattered),
+                        ('L-shaped grid',lShaped)):
+        yield name,coords,np.vstack((offPlaneProbes,notchProbes,coords[::37]+0.1))
+
+    yield '2d grid',flatGrid[:,:2],np.vstack((offPlaneProbes[:,:2],notchProbes[:,:2],flatGrid[::37,:2]+0.1))
+
+
+def testWithinRadius():
+    for name,coords,probes in grids():
+        for radius in (0,0.3,0.5,1.0,2.5,12.0):
+            found = SpatialIndex(coords).withinRadius(probes,radius)
+            expected = bruteForceWithinRadius(coords,probes,radius)
+            assert all(np.array_equal(foundPoints,expectedPoints) for foundPoints,expectedPoints in
+                       zip(found,expected)), 'withinRadius differs for the %s with radius %s.'%(name,radius)
+
+
+def testNearest():
+    for name,coords,probes in grids():
+        for cellSize in (None,0.5,3.0):
+            nearestIdx,distance = SpatialIndex(coords,cellSize).nearest(probes,returnDistance=True)
+            expected = bruteForceNearestDistance(coords,probes)
+            assert np.allclose(distance,expected), 'nearest differs for the %s with cellSize %s.'%(name,cellSize)
+            assert np.allclose(np.sqrt(((coords[nearestIdx]-probes)**2).sum(axis=1)),expected)
+
+
+def testSmallChunks():
+    # Process a few probes at a time, so that the results are joined from many chunks.
+    maxPairs = spatial._maxPairs
+    spatial._maxPairs = 64
+    try:
+        testWithinRadius()
+        testNearest()
+    finally:
+        spatial._maxPairs = maxPairs
+
+
+if __name__ == '__main__':
+    for test in (testWithinRadius,testNearest,testSmallChunks):
+        test()
+        print("%s: OK"%test.__name__)